@@ -0,0 +1,105 @@
+import os
+import time
+from collections import OrderedDict, namedtuple
+
+
+# حالة اشتراك المستخدم كما هي بجدول users
+AccessState = namedtuple("AccessState", "is_active is_blocked sub_expires_at")
+
+# يرجعها get إذا المستخدم مو موجود بالكاش
+MISSING = object()
+
+
+def state_of(user):
+    """يحوّل User إلى AccessState (أو None إذا ما في مستخدم)."""
+    if not user:
+        return None
+    return AccessState(
+        bool(getattr(user, "is_active", False)),
+        bool(getattr(user, "is_blocked", False)),
+        getattr(user, "sub_expires_at", None),
+    )
+
+
+def allowed(state) -> bool:
+    if not state:
+        return False
+    if state.is_blocked:
+        return False
+    if not state.is_active:
+        return False
+    return True
+
+
+class AccessCache:
+    """كاش LRU محدود الحجم مع TTL لحالة الاشتراك.
+
+    يشتغل فقط من الـ event loop، فما يحتاج locks.
+    القيمة None معناها المستخدم مو موجود بقاعدة البيانات.
+
+    تحميل من القاعدة بلّش قبل invalidate وخلص بعده ما لازم يرجّع الحالة القديمة:
+    token() قبل التحميل، و put(uid, state, token) بيترمى إذا المستخدم انمسح بعده.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._seq = 0
+        self._invalidated = OrderedDict()  # uid → _seq وقت آخر invalidate
+        self._floor = 0  # أكبر seq انشال من _invalidated؛ token أقدم منه ما منثق فيه
+
+    def get(self, uid: int):
+        item = self._data.get(uid)
+        if item is None:
+            self.misses += 1
+            return MISSING
+
+        expires_at, state = item
+        if expires_at < time.monotonic():
+            del self._data[uid]
+            self.misses += 1
+            return MISSING
+
+        self._data.move_to_end(uid)
+        self.hits += 1
+        return state
+
+    def token(self) -> int:
+        return self._seq
+
+    def put(self, uid: int, state, token: int = None):
+        if token is not None and (token < self._floor or self._invalidated.get(uid, 0) > token):
+            return
+        self._data[uid] = (time.monotonic() + self.ttl, state)
+        self._data.move_to_end(uid)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def update(self, uid: int, **fields):
+        """يعدّل الحالة المخزنة إذا موجودة (بدون ما يحسبها hit/miss)."""
+        item = self._data.get(uid)
+        if item and item[1] is not None:
+            self._data[uid] = (item[0], item[1]._replace(**fields))
+
+    def invalidate(self, uid: int):
+        self._data.pop(uid, None)
+        self._seq += 1
+        self._invalidated[uid] = self._seq
+        self._invalidated.move_to_end(uid)
+        while len(self._invalidated) > self.maxsize:
+            _, self._floor = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+access_cache = AccessCache(
+    maxsize=int(os.getenv("ACCESS_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ACCESS_CACHE_TTL", "300")),
+)
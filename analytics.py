@@ -0,0 +1,93 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, select, true
+
+from db import run_db, read_only, User, Person, Debt
+from money import format_minor
+
+
+# كل كم ثانية الـ job بيحدّث اللقطة، و"قريب ينتهي" = خلال كم يوم
+ANALYTICS_REFRESH = float(os.getenv("ANALYTICS_REFRESH", "300"))
+EXPIRING_DAYS = 7
+
+
+@read_only
+def _collect(db) -> dict:
+    """كل الأرقام باستعلام واحد: subquery لكل جدول بـ COUNT/SUM ... FILTER."""
+    now = datetime.utcnow()
+    soon = now + timedelta(days=EXPIRING_DAYS)
+
+    users = select(
+        func.count().label("total"),
+        func.count().filter(User.is_active == True).label("active"),
+        func.count().filter(User.is_blocked == True).label("blocked"),
+        func.count().filter(and_(
+            User.is_active == True,
+            User.sub_expires_at >= now,
+            User.sub_expires_at < soon,
+        )).label("expiring"),
+    ).subquery()
+
+    people = select(func.count().label("total")).select_from(Person).subquery()
+
+    open_debt = Debt.status == "open"
+    debts = select(
+        func.count().filter(open_debt).label("open"),
+        func.coalesce(func.sum(Debt.amount_minor).filter(and_(open_debt, Debt.currency == "USD")), 0).label("usd"),
+        func.coalesce(func.sum(Debt.amount_minor).filter(and_(open_debt, Debt.currency == "SYP")), 0).label("syp"),
+    ).subquery()
+
+    # كل subquery صف واحد، فالـ join بـ true() بيجمعهم بصف واحد
+    row = db.execute(
+        select(users, people.c.total.label("people"), debts)
+        .select_from(users.join(people, true()).join(debts, true()))
+    ).one()
+    return {
+        "users": row.total,
+        "active": row.active,
+        "blocked": row.blocked,
+        "expiring": row.expiring,
+        "people": row.people,
+        "open_debts": row.open,
+        "USD": row.usd,
+        "SYP": row.syp,
+    }
+
+
+# آخر لقطة (dict) ووقتها؛ الـ job بيحدّثها و/stats بيقرأها بس
+_snapshot = None
+_taken_at = 0.0
+
+
+async def refresh():
+    global _snapshot, _taken_at
+    _snapshot = await run_db(_collect)
+    _taken_at = time.time()
+    return _snapshot
+
+
+async def refresh_job(context):
+    await refresh()
+
+
+async def get_snapshot():
+    """اللقطة الحالية وعمرها بالثواني. إذا لسا ما انحسبت بنحسبها مرة."""
+    if _snapshot is None:
+        await refresh()
+    return _snapshot, time.time() - _taken_at
+
+
+def format_snapshot(data: dict, age: float) -> str:
+    return (
+        f"👥 المستخدمين: {data['users']}\n"
+        f"⭐ المشتركين: {data['active']}\n"
+        f"🚫 المحظورين: {data['blocked']}\n"
+        f"⏳ ينتهي اشتراكهم خلال {EXPIRING_DAYS} أيام: {data['expiring']}\n"
+        f"👤 الأشخاص: {data['people']}\n"
+        f"🧾 الديون المفتوحة: {data['open_debts']}\n"
+        f"💵 USD: {format_minor(data['USD'])}\n"
+        f"💴 SYP: {format_minor(data['SYP'])}\n"
+        f"🕒 قبل {age:.0f} ثانية"
+    )
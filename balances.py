@@ -0,0 +1,90 @@
+from decimal import Decimal
+
+from sqlalchemy import and_, func
+
+from db import read_only, User, Person, Debt
+from money import format_minor
+
+
+# ---------------------------
+# أرصدة الأشخاص (استعلام مجمّع واحد بدل جلب كل دين لحال)
+# ---------------------------
+
+@read_only
+def person_balances(db, uid: int, person_ids) -> dict:
+    """{person_id: {currency: total_minor}} لكل الأشخاص المطلوبين بـ GROUP BY واحد."""
+    person_ids = list(person_ids)
+    if not person_ids:
+        return {}
+
+    rows = (
+        db.query(Debt.person_id, Debt.currency, func.sum(Debt.amount_minor))
+        .filter(
+            Debt.owner_user_id == uid,
+            Debt.person_id.in_(person_ids),
+            Debt.status == "open",
+        )
+        .group_by(Debt.person_id, Debt.currency)
+        .all()
+    )
+
+    result = {}
+    for person_id, currency, total in rows:
+        result.setdefault(person_id, {})[currency] = total
+    return result
+
+
+@read_only
+def person_summary(db, uid: int, person_id: int):
+    """اسم الشخص + أرصدته + سعر الدولار عند المالك، باستعلام واحد.
+
+    يرجع None إذا الشخص مو موجود أو مو لهالمالك.
+    """
+    rows = (
+        db.query(Person.name, User.usd_rate, Debt.currency, func.sum(Debt.amount_minor))
+        .outerjoin(User, User.tg_user_id == Person.owner_user_id)
+        .outerjoin(Debt, and_(
+            Debt.person_id == Person.id,
+            Debt.owner_user_id == uid,
+            Debt.status == "open",
+        ))
+        .filter(Person.id == person_id, Person.owner_user_id == uid)
+        .group_by(Person.name, User.usd_rate, Debt.currency)
+        .all()
+    )
+    if not rows:
+        return None
+
+    name, usd_rate = rows[0][0], rows[0][1]
+    balances = {currency: total for _, _, currency, total in rows if currency}
+    return name, balances, usd_rate
+
+
+# ---------------------------
+# تحويل وعرض
+# ---------------------------
+
+def total_in_usd(balances: dict, usd_rate):
+    """مجموع الأرصدة بالدولار (بالوحدة الصغرى) حسب سعر المالك (SYP لكل USD).
+    None إذا في SYP وما في سعر."""
+    total = int(balances.get("USD") or 0)
+    syp = balances.get("SYP")
+    if syp:
+        if not usd_rate:
+            return None
+        total += int((Decimal(int(syp)) / Decimal(str(usd_rate))).to_integral_value())
+    return total
+
+
+def format_balances(balances: dict, usd_rate=None) -> str:
+    if not balances:
+        return "0"
+
+    parts = [f"{format_minor(total)} {currency}" for currency, total in sorted(balances.items())]
+    text = " + ".join(parts)
+
+    if len(balances) > 1:
+        usd = total_in_usd(balances, usd_rate)
+        if usd is not None:
+            text += f" ≈ {format_minor(usd)} USD"
+    return text
@@ -0,0 +1,216 @@
+import asyncio
+import os
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from db import run_db, read_only, Broadcast, User
+
+
+# حدود تيليجرام: تقريباً 30 رسالة بالثانية لكل البوت.
+# حد الشات الواحد (رسالة بالثانية) ما بيأثر هون لأن كل مستخدم بياخد رسالة وحدة.
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+CHUNK_SIZE = 200
+PROGRESS_EVERY = 5.0     # ثواني بين كل تعديل لرسالة التقدم
+MAX_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """Token bucket بسيط: rate توكن بالثانية وسعة capacity.
+
+    pause() يوقف الكل (لما تيليجرام يرجع RetryAfter).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# ---------------------------
+# استعلامات (تشتغل داخل run_db)
+# ---------------------------
+
+def _create_job(db, admin_chat_id: int, text: str) -> int:
+    job = Broadcast(admin_chat_id=admin_chat_id, text=text)
+    db.add(job)
+    db.flush()
+    return job.id
+
+
+def _set_progress_message(db, job_id: int, message_id: int):
+    db.query(Broadcast).filter(Broadcast.id == job_id).update(
+        {Broadcast.progress_message_id: message_id}
+    )
+
+
+def _load_job(db, job_id: int):
+    job = db.query(Broadcast).filter(Broadcast.id == job_id).first()
+    return {
+        "text": job.text,
+        "admin_chat_id": job.admin_chat_id,
+        "progress_message_id": job.progress_message_id,
+        "cursor": job.cursor,
+        "sent": job.sent,
+        "failed": job.failed,
+        "blocked": job.blocked,
+    }
+
+
+def _running_job_ids(db):
+    return [jid for (jid,) in db.query(Broadcast.id).filter(Broadcast.status == "running").all()]
+
+
+@read_only
+def _next_chunk(db, cursor: int, limit: int):
+    rows = (
+        db.query(User.tg_user_id)
+        .filter(User.tg_user_id > cursor)
+        .order_by(User.tg_user_id)
+        .limit(limit)
+        .all()
+    )
+    return [uid for (uid,) in rows]
+
+
+def _save_progress(db, job_id: int, state: dict, status: str = "running"):
+    db.query(Broadcast).filter(Broadcast.id == job_id).update({
+        Broadcast.cursor: state["cursor"],
+        Broadcast.sent: state["sent"],
+        Broadcast.failed: state["failed"],
+        Broadcast.blocked: state["blocked"],
+        Broadcast.status: status,
+    })
+
+
+# ---------------------------
+# الإرسال
+# ---------------------------
+
+async def send_one(bot, bucket: TokenBucket, chat_id: int, text: str) -> str:
+    for _ in range(MAX_ATTEMPTS):
+        await bucket.acquire()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            return "sent"
+        except RetryAfter as e:
+            bucket.pause(float(e.retry_after))
+        except Forbidden:
+            return "blocked"
+        except BadRequest:
+            return "failed"
+        except NetworkError:
+            await asyncio.sleep(1)
+        except TelegramError:
+            return "failed"
+    return "failed"
+
+
+def _progress_text(state: dict, started: float, done: bool = False) -> str:
+    elapsed = max(time.monotonic() - started, 0.001)
+    head = "📢 انتهى الإرسال" if done else "📢 جاري الإرسال..."
+    return (
+        f"{head}\n"
+        f"✅ أُرسلت: {state['sent']}\n"
+        f"❌ فشلت: {state['failed']}\n"
+        f"🚫 حاظرين البوت: {state['blocked']}\n"
+        f"⚡ {state['sent'] / elapsed:.1f} رسالة/ثانية"
+    )
+
+
+async def _edit_progress(bot, state: dict, started: float, done: bool = False):
+    if not state["progress_message_id"]:
+        return
+    try:
+        await bot.edit_message_text(
+            _progress_text(state, started, done),
+            chat_id=state["admin_chat_id"],
+            message_id=state["progress_message_id"],
+        )
+    except TelegramError:
+        pass
+
+
+async def run_broadcast(bot, job_id: int):
+    state = await run_db(_load_job, job_id)
+    bucket = TokenBucket(BROADCAST_RATE)
+    sem = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    started = time.monotonic()
+    last_edit = 0.0
+
+    async def send(chat_id):
+        async with sem:
+            result = await send_one(bot, bucket, chat_id, state["text"])
+        state[result] += 1
+
+    while True:
+        ids = await run_db(_next_chunk, state["cursor"], CHUNK_SIZE)
+        if not ids:
+            break
+
+        await asyncio.gather(*(send(chat_id) for chat_id in ids))
+
+        # نحفظ المؤشر بعد كل دفعة؛ بعد crash ممكن تتكرر آخر دفعة بس
+        state["cursor"] = ids[-1]
+        await run_db(_save_progress, job_id, state)
+
+        if time.monotonic() - last_edit >= PROGRESS_EVERY:
+            last_edit = time.monotonic()
+            await _edit_progress(bot, state, started)
+
+    await run_db(_save_progress, job_id, state, "done")
+    await _edit_progress(bot, state, started, done=True)
+
+
+# ما منستعمل application.create_task لأن stop() بيستنى كل مهامه،
+# والرسالة الجماعية ممكن تطوّل ساعات. بالإيقاف منلغيها وبنكمّل من المؤشر.
+_tasks = set()
+
+
+def _spawn(bot, job_id: int):
+    task = asyncio.create_task(run_broadcast(bot, job_id), name=f"broadcast:{job_id}")
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def start_broadcast(bot, admin_chat_id: int, text: str) -> int:
+    job_id = await run_db(_create_job, admin_chat_id, text)
+    msg = await bot.send_message(chat_id=admin_chat_id, text="📢 جاري الإرسال...")
+    await run_db(_set_progress_message, job_id, msg.message_id)
+    _spawn(bot, job_id)
+    return job_id
+
+
+async def resume_broadcasts(bot):
+    """يكمّل أي رسالة جماعية وقفت بالنص (restart / crash)."""
+    for job_id in await run_db(_running_job_ids):
+        _spawn(bot, job_id)
+
+
+async def stop_broadcasts():
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
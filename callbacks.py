@@ -0,0 +1,202 @@
+import base64
+import re
+from functools import lru_cache
+
+from telegram.ext import ApplicationHandlerStop, CallbackQueryHandler
+
+
+# ---------------------------
+# callback_data مضغوطة: "~" + base64url(نسخة، رقم الـ action، أرقام varint).
+# Telegram بيقبل لحد 64 byte؛ زر فيه id و cursor بياخد ~12 حرف.
+# الأزرار القديمة (person_12 / people_n_5 ...) بتضل موجودة برسائل قديمة، فمنفهمها كمان.
+# ---------------------------
+
+VERSION = 1
+PREFIX = "~"  # مو موجود بأي زر قديم ولا بـ base64url
+MAX_BYTES = 64
+
+# رقم كل action ثابت: الأزرار القديمة بتضل تبعت الرقم، لا تغيّر الأرقام ولا تعيد استعمالها
+ACTIONS = {
+    "menu": 1,
+    "help": 2,
+    "admin": 3,
+    "add": 4,
+    "people": 5,        # (direction, cursor): 0 = التالي (before)، 1 = السابق (after)
+    "person": 6,        # (person_id,)
+    "delete_all": 7,    # (person_id,)
+    "partial": 8,       # (person_id,)
+    "statement": 9,     # (person_id, before_entry_id?)
+    "rate": 10,
+    "admin_stats": 11,
+    "admin_sub": 12,
+    "admin_extend": 13,
+    "admin_cancel": 14,
+    "admin_ban": 15,
+    "admin_unban": 16,
+    "admin_broadcast": 17,
+    "admin_subscribers": 18,
+}
+_NAMES = {code: name for name, code in ACTIONS.items()}
+
+# كم رقم بياخد كل action (أقل، أكتر)؛ اللي مو هون ما بياخد شي. زر عدده غلط = زر قديم
+ARGS = {
+    "people": (0, 2),
+    "person": (1, 1),
+    "delete_all": (1, 1),
+    "partial": (1, 1),
+    "statement": (1, 2),
+}
+
+# الأرقام كلها ids بأعمدة Integer؛ أكبر من هيك القاعدة بترفض (DataError)
+MAX_ARG = 2 ** 31 - 1
+
+# أسماء قديمة مختلفة عن الجديدة: الاسم القديم → (action، args قبل أرقام الزر)
+_LEGACY = {
+    "back_main": ("menu", ()),
+    "people_n": ("people", (0,)),
+    "people_p": ("people", (1,)),
+}
+_LEGACY_DATA = re.compile(r"^([a-z_]+?)((?:_\d+)*)$")
+
+
+def _write_varint(buf: bytearray, n: int):
+    if n < 0:
+        raise ValueError(n)
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _read_varints(raw: bytes):
+    values, n, shift = [], 0, 0
+    for byte in raw:
+        n |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(n)
+            n, shift = 0, 0
+    if shift:
+        raise ValueError("truncated varint")
+    return tuple(values)
+
+
+def encode(action: str, *args: int) -> str:
+    """callback_data لزر: encode("person", 12) → "~AQYM"."""
+    buf = bytearray((VERSION, ACTIONS[action]))
+    for n in args:
+        _write_varint(buf, n)
+    data = PREFIX + base64.urlsafe_b64encode(bytes(buf)).rstrip(b"=").decode()
+    if len(data) > MAX_BYTES:
+        raise ValueError(f"callback data too long for {action}: {len(data)}")
+    return data
+
+
+def _checked(action: str, args: tuple):
+    low, high = ARGS.get(action, (0, 0))
+    if not low <= len(args) <= high or any(n > MAX_ARG for n in args):
+        return None
+    return action, args
+
+
+@lru_cache(maxsize=4096)
+def decode(data: str):
+    """(action, args) أو None إذا الزر مو مفهوم (نسخة أحدث / قديم كتير / مخربط،
+    أو عدد الأرقام مو متل ARGS)."""
+    if not data:
+        return None
+
+    if data.startswith(PREFIX):
+        try:
+            raw = base64.urlsafe_b64decode(data[1:] + "=" * (-len(data[1:]) % 4))
+            if len(raw) < 2 or raw[0] != VERSION or raw[1] not in _NAMES:
+                return None
+            return _checked(_NAMES[raw[1]], _read_varints(raw[2:]))
+        except ValueError:
+            return None
+
+    match = _LEGACY_DATA.match(data)
+    if not match:
+        return None
+    name, digits = match.groups()
+    numbers = tuple(int(n) for n in digits.split("_") if n)
+    if name in _LEGACY:
+        action, prefix = _LEGACY[name]
+        return _checked(action, prefix + numbers)
+    if name in ACTIONS:
+        return _checked(name, numbers)
+    return None
+
+
+def matches(action: str):
+    """pattern لـ CallbackQueryHandler (نقاط دخول المحادثات)."""
+    def check(data) -> bool:
+        decoded = decode(data) if isinstance(data, str) else None
+        return decoded is not None and decoded[0] == action
+    check.pattern = f"cb:{action}"  # label بالـ metrics
+    return check
+
+
+# ---------------------------
+# الراوتر: handler واحد بالـ group -1 لكل الأزرار
+# ---------------------------
+
+class CallbackRouter(CallbackQueryHandler):
+    """بيفك الزر، بيفحص الصلاحية مرة وحدة، وبينادي الـ route من جدول (dict).
+
+    args الزر بتوصل للـ route بـ context.args. الـ actions اللي بتبلّش محادثة
+    (pass_through) بتكمّل للـ ConversationHandler بالـ group 0 بعد الفحص.
+    """
+
+    def __init__(self, check_access, is_admin, denied_text: str):
+        super().__init__(self._route)
+        self.check_access = check_access
+        self.is_admin = is_admin
+        self.denied_text = denied_text
+        self.routes = {}
+        self.admin_only = set()
+        self.passed_through = set()
+
+    def add(self, action: str, callback, admin: bool = False):
+        if action not in ACTIONS:
+            raise KeyError(action)
+        self.routes[action] = callback
+        if admin:
+            self.admin_only.add(action)
+
+    def add_routes(self, routes: dict):
+        for action, callback in routes.items():
+            self.add(action, callback)
+
+    def pass_through(self, *actions: str):
+        self.passed_through.update(actions)
+
+    async def _route(self, update, context):
+        q = update.callback_query
+        decoded = decode(q.data)
+        if decoded is None:
+            await q.answer("⌛ الزر قديم، ابعت /start", show_alert=True)
+            raise ApplicationHandlerStop
+
+        action, args = decoded
+        context.args = list(args)
+        uid = q.from_user.id
+
+        if action in self.admin_only and not self.is_admin(uid):
+            await q.answer("🚫 للأدمن فقط", show_alert=True)
+            raise ApplicationHandlerStop
+        if not await self.check_access(uid):
+            await q.answer()
+            await q.message.reply_text(self.denied_text)
+            raise ApplicationHandlerStop
+
+        if action in self.passed_through:
+            return
+
+        callback = self.routes.get(action)
+        if callback is None:
+            await q.answer()
+        else:
+            await callback(update, context)
+        raise ApplicationHandlerStop
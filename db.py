@@ -1,5 +1,12 @@
 import os
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import partial
 
 from sqlalchemy import (
     create_engine,
@@ -7,20 +14,19 @@ from sqlalchemy import (
     Integer,
     BigInteger,
     String,
+    Text,
     Boolean,
     Float,
     DateTime,
     ForeignKey,
+    Index,
+    JSON,
     func,
 )
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session
 
 
-def _get_database_url() -> str:
-    url = os.getenv("DATABASE_URL", "")
-    if not url:
-        raise RuntimeError("DATABASE_URL is not set")
-
+def _normalize_url(url: str) -> str:
     # Railway أحياناً يعطي postgres:// لازم تتحول
     if url.startswith("postgres://"):
         url = url.replace("postgres://", "postgresql+psycopg2://", 1)
@@ -30,10 +36,96 @@ def _get_database_url() -> str:
     return url
 
 
+def _get_database_url() -> str:
+    url = os.getenv("DATABASE_URL", "")
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set")
+    return _normalize_url(url)
+
+
 DATABASE_URL = _get_database_url()
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# replica للقراءة (اختياري). الدوال المعلّمة بـ @read_only بس بتقرأ منها، شوف RoutingSession
+READ_DATABASE_URL = _normalize_url(os.getenv("READ_DATABASE_URL", "")) or None
+
+# بعد ما المستخدم يكتب، قراءاته بتضل من الـ primary هالمدة (تأخير الـ replica)
+REPLICA_LAG_WINDOW = float(os.getenv("REPLICA_LAG_WINDOW", "5"))
+
+# عدد الـ threads اللي تشتغل على قاعدة البيانات = حجم الـ pool
+# حتى ما يستنى أي thread على connection
+DB_WORKERS = int(os.getenv("DB_WORKERS", "8"))
+
+# كل update شغال بيمسك connection لحد ما يخلص (unit_of_work تحت)، فالـ overflow
+# لازم يكفي CONCURRENT_UPDATES فوق الـ pool تبع الـ jobs
+def _create_engine(url: str):
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=DB_WORKERS,
+        max_overflow=int(os.getenv("CONCURRENT_UPDATES", "16")),
+    )
+
+
+# الـ engines بينبنوا أول ما حدا يحتاجهم (مو وقت الـ import): الـ driver بينستورد
+# وقتها. db.engine / db.read_engine لسا شغالين من برا (__getattr__ تحت).
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(read: bool = False):
+    """الـ primary، أو الـ replica إذا read (None إذا ما في READ_DATABASE_URL)."""
+    key = "read" if read else "primary"
+    if key not in _engines:
+        with _engines_lock:
+            if key not in _engines:
+                url = READ_DATABASE_URL if read else DATABASE_URL
+                _engines[key] = _create_engine(url) if url else None
+    return _engines[key]
+
+
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    if name == "read_engine":
+        return get_engine(read=True)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _is_read(clause) -> bool:
+    # SELECT عادي بس؛ FOR UPDATE و text() و DML كلهم على الـ primary
+    return (
+        clause is not None
+        and getattr(clause, "is_select", False)
+        and getattr(clause, "_for_update_arg", None) is None
+    )
+
+
+class RoutingSession(Session):
+    """session بتبعت القراءات للـ replica طول ما info["replica"] شغّال.
+
+    أول كتابة (flush / DML / FOR UPDATE) بتطفيه لباقي الـ session وبتعلّم
+    info["wrote"]، فكل شي بعدها بيقرأ من الـ primary ويشوف الكتابة.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        engine = get_engine()
+        # get_bind() بدون statement (الـ dialect، session.connection()) = الـ primary
+        if clause is None and not self._flushing:
+            return engine
+        if _is_read(clause) and not self._flushing:
+            read_engine = get_engine(read=True)
+            if read_engine is not None and self.info.get("replica"):
+                return read_engine
+            return engine
+
+        self.info["replica"] = False
+        self.info["wrote"] = True
+        return engine
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
 
 Base = declarative_base()
 
@@ -51,7 +143,10 @@ class User(Base):
     is_blocked = Column(Boolean, default=False, nullable=False)
 
     usd_rate = Column(Float, nullable=True)
-    sub_expires_at = Column(DateTime(timezone=False), nullable=True)
+    # عليه index لأن subscriptions.py بيمشي عليه كل كم دقيقة
+    sub_expires_at = Column(DateTime(timezone=False), nullable=True, index=True)
+    # قيمة sub_expires_at اللي بعتنا عنها تنبيه "قرب ينتهي" (حتى ما نكرر)
+    expiry_notice_for = Column(DateTime(timezone=False), nullable=True)
 
     # ملاحظة: جدول users عندك ما فيه updated_at (حسب اللوج)
     created_at = Column(DateTime(timezone=False), server_default=func.now(), nullable=False)
@@ -65,13 +160,15 @@ class Person(Base):
 
     id = Column(Integer, primary_key=True, index=True)
 
+    # الـ index المركّب تحت بيغطي الفلترة على owner_user_id لحاله
     owner_user_id = Column(
         BigInteger,
         ForeignKey("users.tg_user_id", ondelete="CASCADE"),
         nullable=False,
-        index=True,
     )
     name = Column(String(120), nullable=False)
+    # الاسم بعد التطبيع (names.normalize_name)، شخص واحد لكل مفتاح عند نفس المالك
+    name_key = Column(String(120), nullable=False)
 
     # ملاحظة: جدول people عندك يطلب created_at (كان يطلع NOT NULL)
     created_at = Column(DateTime(timezone=False), server_default=func.now(), nullable=False)
@@ -79,17 +176,23 @@ class Person(Base):
     owner = relationship("User", back_populates="people")
     debts = relationship("Debt", back_populates="person", cascade="all, delete-orphan")
 
+    # قائمة الأشخاص بتمشي keyset على (owner_user_id, id DESC)
+    __table_args__ = (
+        Index("ix_people_owner_id", "owner_user_id", id.desc()),
+        Index("ux_people_owner_name_key", "owner_user_id", "name_key", unique=True),
+    )
+
 
 class Debt(Base):
     __tablename__ = "debts"
 
     id = Column(Integer, primary_key=True, index=True)
 
+    # الـ index المركّب تحت بيغطي الفلترة على owner_user_id لحاله
     owner_user_id = Column(
         BigInteger,
         ForeignKey("users.tg_user_id", ondelete="CASCADE"),
         nullable=False,
-        index=True,
     )
     person_id = Column(
         Integer,
@@ -98,12 +201,17 @@ class Debt(Base):
         index=True,
     )
 
-    amount = Column(Float, nullable=False)
+    # المبلغ بالوحدة الصغرى (سنت) كعدد صحيح، شوف money.py
+    # (العمود القديم amount كان Float، الترحيل 1 بـ migrations.py بينقل القيم)
+    amount_minor = Column(BigInteger, nullable=False)
     currency = Column(String(3), nullable=False)  # USD / SYP
 
     # كان عندك خطأ: status NOT NULL
     status = Column(String(20), default="open", nullable=False)
 
+    note = Column(String(255), nullable=True)
+    due_date = Column(DateTime(timezone=False), nullable=True)
+
     # كان عندك خطأ: updated_at NOT NULL
     created_at = Column(DateTime(timezone=False), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=False), default=_now, nullable=False)
@@ -111,6 +219,298 @@ class Debt(Base):
     owner = relationship("User", back_populates="debts")
     person = relationship("Person", back_populates="debts")
 
+    # كل استعلامات الديون بتفلتر على (owner_user_id, person_id)
+    __table_args__ = (
+        Index("ix_debts_owner_person", "owner_user_id", "person_id"),
+    )
+
+
+class LedgerEntry(Base):
+    """سجل حركات الديون، append-only: ما في UPDATE ولا DELETE (شوف ledger.py).
+
+    amount_minor بإشارة: الدين موجب، التسديد والشطب سالب.
+    """
+    __tablename__ = "ledger_entries"
+
+    id = Column(Integer, primary_key=True)
+
+    owner_user_id = Column(
+        BigInteger,
+        ForeignKey("users.tg_user_id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    person_id = Column(
+        Integer,
+        ForeignKey("people.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # بدون FK: الحركة بتضل حتى لو الدين تغيّر
+    debt_id = Column(Integer, nullable=True)
+
+    kind = Column(String(10), nullable=False)  # debt / payment / writeoff
+    currency = Column(String(3), nullable=False)
+    amount_minor = Column(BigInteger, nullable=False)
+    note = Column(String(255), nullable=True)
+
+    created_at = Column(DateTime(timezone=False), default=_now, nullable=False)
+
+    # كشف الحساب والرصيد = range على (owner_user_id, person_id, id)
+    __table_args__ = (
+        Index("ix_ledger_owner_person_id", "owner_user_id", "person_id", "id"),
+    )
+
+
+class BalanceSnapshot(Base):
+    """رصيد شخص لحد حركة معيّنة، بينكتب كل كم حركة حتى ما نجمع كل السجل."""
+    __tablename__ = "balance_snapshots"
+
+    id = Column(Integer, primary_key=True)
+
+    owner_user_id = Column(BigInteger, nullable=False)
+    person_id = Column(
+        Integer,
+        ForeignKey("people.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    last_entry_id = Column(Integer, nullable=False)
+    taken_at = Column(DateTime(timezone=False), nullable=False)  # created_at تبع last_entry_id
+    balances = Column(JSON, nullable=False)  # {currency: minor}
+
+    __table_args__ = (
+        Index("ix_snapshots_owner_person_entry", "owner_user_id", "person_id", "last_entry_id"),
+    )
+
+
+class OwnerSummary(Base):
+    """ملخص جاهز لكل مالك (للقائمة الرئيسية). يتحدث مع كل كتابة، شوف summary.py"""
+    __tablename__ = "owner_summaries"
+
+    owner_user_id = Column(BigInteger, primary_key=True)
+
+    people_count = Column(Integer, default=0, nullable=False)
+    open_debts = Column(Integer, default=0, nullable=False)
+    usd_minor = Column(BigInteger, default=0, nullable=False)
+    syp_minor = Column(BigInteger, default=0, nullable=False)
+
+    updated_at = Column(DateTime(timezone=False), default=_now, onupdate=_now, nullable=False)
+
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    admin_chat_id = Column(BigInteger, nullable=False)
+    progress_message_id = Column(Integer, nullable=True)
+    text = Column(Text, nullable=False)
+
+    # آخر tg_user_id انبعتله (المستخدمين ينمشوا بالترتيب) حتى نكمّل بعد restart
+    cursor = Column(BigInteger, default=0, nullable=False)
+
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    blocked = Column(Integer, default=0, nullable=False)
+
+    status = Column(String(20), default="running", nullable=False)  # running / done
+
+    created_at = Column(DateTime(timezone=False), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=False), default=_now, onupdate=_now, nullable=False)
+
+
+class BotUserData(Base):
+    """context.user_data محفوظة (شوف persistence.py)"""
+    __tablename__ = "bot_user_data"
+
+    user_id = Column(BigInteger, primary_key=True)
+    data = Column(JSON, nullable=False)
+    updated_at = Column(DateTime(timezone=False), default=_now, onupdate=_now, nullable=False)
+
+
+class BotConversation(Base):
+    """حالة المحادثات اللي لسا ما خلصت فقط"""
+    __tablename__ = "bot_conversations"
+
+    name = Column(String(64), primary_key=True)
+    key = Column(String(64), primary_key=True)  # JSON لمفتاح المحادثة (chat_id, user_id)
+    state = Column(JSON, nullable=False)
+    updated_at = Column(DateTime(timezone=False), default=_now, onupdate=_now, nullable=False)
+
+
+class SchemaVersion(Base):
+    """كل صف = ترحيل اتطبق (شوف migrations.py)"""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime(timezone=False), default=_now, nullable=False)
+
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    # إنشاء الجداول + الترحيلات بالترتيب، وما بيعمل شي إذا النسخة محدّثة
+    from migrations import migrate
+    migrate(get_engine())
+
+
+# ---------------------------
+# replica: مين بيقرأ منها
+# ---------------------------
+
+def read_only(fn):
+    """علامة لدالة run_db ما بتكتب: استعلاماتها بتروح للـ replica إذا في وحدة."""
+    fn.read_only = True
+    return fn
+
+
+_recent_writers = {}  # owner → monotonic وقت آخر commit فيه كتابة
+
+
+def _wrote(owner):
+    now = time.monotonic()
+    _recent_writers[owner] = now
+    if len(_recent_writers) > 10000:
+        for key, at in list(_recent_writers.items()):
+            if now - at > REPLICA_LAG_WINDOW:
+                _recent_writers.pop(key, None)
+
+
+def _use_replica(fn, owner=None) -> bool:
+    if get_engine(read=True) is None or not getattr(fn, "read_only", False):
+        return False
+    at = _recent_writers.get(owner) if owner is not None else None
+    return at is None or time.monotonic() - at > REPLICA_LAG_WINDOW
+
+
+# ---------------------------
+# وصول غير متزامن لقاعدة البيانات
+#
+# الدوال اللي بتنبعت لـ run_db ما بتعمل commit: بتعمل flush إذا بدها id، و run_db
+# بيعمل commit إذا كتبت. برا أي update (jobs، broadcast) كل run_db إله session.
+# جوّا update (scheduler.py بيفتح unit_of_work) كل الـ run_db بنفس الـ update
+# بيشاركوا session وحدة، بس كل run_db كتب بيعمل commit لحاله قبل ما يرجع:
+# ما منمسك locks (FOR UPDATE، owner_summaries) وقت طلبات Telegram.
+# ---------------------------
+
+class UnitOfWork:
+    """session وحدة لـ update واحد، بتنفتح أول ما حدا يحتاجها.
+
+    القراءات بتضل على نفس الـ connection لحد أول كتابة؛ الـ run_db اللي بيكتب
+    بيعمل commit قبل ما يرجع، فلما الـ handler يرد على المستخدم الكتابة ثابتة.
+    الـ session بتتسكّر لما يخلص الـ update.
+
+    بتستعملها بس الـ task اللي فتحتها؛ tasks تانية انخلقت من جوّا الـ update
+    (broadcast مثلاً) بتاخد session خاصة فيها متل قبل.
+
+    owner (المستخدم) للـ replica: الدوال @read_only بتقرأ منها لحد أول دالة
+    مو read_only (أو أول كتابة)، وبعدها كل الـ update على الـ primary. إذا
+    الـ update كتب، قراءات المستخدم من الـ primary لـ REPLICA_LAG_WINDOW ثانية.
+    """
+
+    def __init__(self, owner=None):
+        self.task = asyncio.current_task()
+        self.owner = owner
+        self.session = None
+
+    def call(self, fn, *args, **kwargs):
+        if self.session is None:
+            self.session = SessionLocal()
+            self.session.info["replica"] = True
+        info = self.session.info
+        info["replica"] = info["replica"] and _use_replica(fn, self.owner)
+        try:
+            result = fn(self.session, *args, **kwargs)
+            return result, _commit_writes(self.session, self.owner)
+        except Exception:
+            # الـ transaction خربت: منرجع عنها وباقي الـ update بيكمل بوحدة جديدة
+            info.pop("after_commit", None)
+            self.session.rollback()
+            raise
+
+    def finish(self):
+        # ما ضل غير قراءات (الكتابات انعملها commit بـ call)
+        self.session.close()
+        self.session = None
+
+
+_unit_of_work = contextvars.ContextVar("db_unit_of_work", default=None)
+
+
+@asynccontextmanager
+async def unit_of_work(owner=None):
+    uow = UnitOfWork(owner)
+    token = _unit_of_work.set(uow)
+    try:
+        yield uow
+    finally:
+        _unit_of_work.reset(token)
+        if uow.session is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(_db_executor, uow.finish)
+
+
+def after_commit(db, callback):
+    """callback() بيتنادى من الـ event loop بعد commit الـ run_db الحالي.
+
+    للكاشات (access_cache، people_index): ما بتتحدث قبل ما الكتابة تثبت، وإذا
+    صار rollback الـ callback بينرمى.
+    """
+    db.info.setdefault("after_commit", []).append(callback)
+
+
+def _commit_writes(db, owner) -> list:
+    """commit إذا الدالة كتبت (أو ضل عندها objects ما انعملها flush).
+    بيرجّع الـ after_commit callbacks."""
+    if db.info.get("wrote") or db.new or db.dirty or db.deleted:
+        db.commit()
+        db.info["wrote"] = False
+        if owner is not None:
+            _wrote(owner)
+    return db.info.pop("after_commit", [])
+
+
+def _call_with_session(owner, fn, *args, **kwargs):
+    db = SessionLocal()
+    db.info["replica"] = _use_replica(fn, owner)
+    try:
+        result = fn(db, *args, **kwargs)
+        return result, _commit_writes(db, owner)
+    finally:
+        db.close()
+
+
+async def run_db(fn, *args, **kwargs):
+    """يشغّل fn(db, *args, **kwargs) على thread من الـ executor.
+
+    fn لازم تكون sync وترجع بيانات عادية (مو ORM objects) لأن الـ session تتسكّر بعدها.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+
+    uow = _unit_of_work.get()
+    if uow is not None and uow.task is asyncio.current_task():
+        call = partial(ctx.run, uow.call, fn, *args, **kwargs)
+    else:
+        # tasks انخلقت من جوّا update (تحميل فهرس البحث مثلاً) بتعرف المستخدم للـ replica
+        owner = uow.owner if uow is not None else None
+        call = partial(ctx.run, _call_with_session, owner, fn, *args, **kwargs)
+    result, callbacks = await loop.run_in_executor(_db_executor, call)
+    for callback in callbacks:
+        callback()
+    return result
+
+
+def warm_pool(count: int = DB_WORKERS):
+    """يفتح connections الـ pool (primary و replica) ويرجّعهم عليه، حتى أول
+    updates بعد الـ restart ما يستنوا TCP / TLS / auth. بينادى من thread بالخلفية؛
+    الفشل مو مشكلة لأن run_db بيفتح connection لحاله."""
+    for engine in (get_engine(), get_engine(read=True)):
+        if engine is None:
+            continue
+        conns = []
+        try:
+            for _ in range(count):
+                conns.append(engine.connect())
+        except Exception as e:
+            print("POOL_WARMUP_ERROR:", repr(e))
+        finally:
+            for conn in conns:
+                conn.close()
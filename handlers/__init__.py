@@ -1 +1,61 @@
+import importlib
 
+
+# ---------------------------
+# manifest: كل الـ handlers، main.build_application بيسجّلهم من هون بالترتيب.
+# الـ commands والأزرار مكتوبين "module:function" والـ module بينستورد أول ما
+# ينادى (lazy). المحادثات بتنبنى وقت التشغيل لأن persistence بترجّع حالتها وقت
+# initialize، فـ add_debt و export_import و people (ومعهم payments / ledger /
+# names / people_index) بينستوردوا على كل حال. التوفير هون صغير (~15ms)؛ معظم
+# وقت الـ import هو telegram و sqlalchemy (شوف scripts/bench_startup.py).
+# ---------------------------
+
+# (group, command, "module:callback")
+COMMANDS = [
+    (0, "rate", "handlers.rates:set_rate"),
+    (0, "export", "handlers.export_import:export_cmd"),
+    (1, "people", "handlers.people:list_people"),
+    (3, "sub", "handlers.admin_panel:sub_cmd"),
+    (3, "extend", "handlers.admin_panel:extend_cmd"),
+    (3, "cancel", "handlers.admin_panel:cancel_cmd"),
+    (3, "ban", "handlers.admin_panel:ban_cmd"),
+    (3, "unban", "handlers.admin_panel:unban_cmd"),
+    (3, "broadcast", "handlers.admin_panel:broadcast_cmd"),
+    (3, "stats", "handlers.admin_panel:stats_cmd"),
+    (3, "rebuild_summary", "handlers.admin_panel:rebuild_summary_cmd"),
+]
+
+# (group, "module:factory") → ConversationHandler
+CONVERSATIONS = [
+    (0, "handlers.add_debt:get_add_debt_handler"),
+    (0, "handlers.export_import:get_import_handler"),
+    (1, "handlers.people:build_partial_conv"),
+]
+
+# action (callbacks.py) → ("module:callback", admin فقط)
+ROUTES = {
+    "people": ("handlers.people:list_people", False),
+    "person": ("handlers.people:show_person", False),
+    "delete_all": ("handlers.people:delete_all", False),
+    "statement": ("handlers.people:show_statement", False),
+    "admin_stats": ("handlers.admin_panel:admin_stats", True),
+}
+
+
+def load(path: str):
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def lazy(path: str):
+    """callback بيستورد الـ module تبعه أول مرة بينادى."""
+    target = None
+
+    async def callback(update, context):
+        nonlocal target
+        if target is None:
+            target = load(path)
+        return await target(update, context)
+
+    callback.__name__ = path.partition(":")[2]
+    return callback
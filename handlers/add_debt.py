@@ -1,4 +1,5 @@
-from decimal import Decimal, InvalidOperation
+from decimal import InvalidOperation
+from functools import partial
 
 from telegram import Update
 from telegram.ext import (
@@ -10,16 +11,38 @@ from telegram.ext import (
     filters,
 )
 
-from db import SessionLocal, User, Person, Debt
+from db import run_db, after_commit, Debt
+from money import parse_amount
+from names import upsert_person
+from people_index import people_index
+from callbacks import matches
+import ledger
+import summary
 
 ASK_NAME, ASK_AMOUNT = range(2)
 
 
-def _normalize_number(text: str) -> str:
-    arabic_digits = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
-    text = (text or "").strip().translate(arabic_digits)
-    text = text.replace(",", "").replace(" ", "")
-    return text
+def _save_debt(db, uid: int, name: str, amount_minor: int):
+    # نفس الاسم (بعد التطبيع) = نفس الشخص، ما منعمل نسخة جديدة
+    person_id, created = upsert_person(db, uid, name)
+
+    debt = Debt(
+        owner_user_id=uid,
+        person_id=person_id,
+        amount_minor=amount_minor,
+        currency="USD",
+        note=None,
+        due_date=None,
+    )
+    db.add(debt)
+    db.flush()
+
+    ledger.append(db, uid, person_id, "debt", "USD", amount_minor, debt_id=debt.id)
+    summary.bump(db, uid, people=int(created), debts=1, currency="USD", amount_minor=amount_minor)
+    if created:
+        # بعد الـ commit بس، وإلا insert رجع rollback بيضل شخص وهمي بالبحث
+        after_commit(db, partial(people_index.add, uid, person_id, name))
+    return person_id, created
 
 
 async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -46,39 +69,17 @@ async def save_debt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     raw_amount = update.message.text or ""
 
     try:
-        normalized = _normalize_number(raw_amount)
-        amount = Decimal(normalized)
-        if amount <= 0:
-            raise InvalidOperation
+        amount_minor = parse_amount(raw_amount)
     except (InvalidOperation, ValueError):
         await update.message.reply_text("❌ اكتب رقم صحيح أكبر من 0 (مثال: 1500)")
         return ASK_AMOUNT
 
-    db = SessionLocal()
     try:
-        person = Person(owner_user_id=uid, name=name)
-        db.add(person)
-        db.commit()
-        db.refresh(person)
-
-        debt = Debt(
-            owner_user_id=uid,
-            person_id=person.id,
-            amount=amount,
-            currency="USD",
-            note=None,
-            due_date=None,
-        )
-        db.add(debt)
-        db.commit()
-
+        await run_db(_save_debt, uid, name, amount_minor)
     except Exception as e:
-        db.rollback()
         print("SAVE_DEBT_ERROR:", repr(e))
         await update.message.reply_text("❌ صار خطأ أثناء حفظ الدين. جرّب مرة ثانية.")
         return ConversationHandler.END
-    finally:
-        db.close()
 
     await update.message.reply_text("✅ تمت إضافة الدين بنجاح")
     return ConversationHandler.END
@@ -93,7 +94,7 @@ def get_add_debt_handler():
     return ConversationHandler(
         entry_points=[
             CommandHandler("add", add_start),
-            CallbackQueryHandler(add_start, pattern="^add$"),
+            CallbackQueryHandler(add_start, pattern=matches("add")),
         ],
         states={
             ASK_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_amount)],
@@ -101,4 +102,6 @@ def get_add_debt_handler():
         },
         fallbacks=[CommandHandler("cancel", cancel_add)],
         allow_reentry=True,
+        name="add_debt",
+        persistent=True,
     )
@@ -1,15 +1,68 @@
 from datetime import datetime, timedelta
+from functools import partial
 
 from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
+from telegram.ext import ContextTypes
 
-from db import SessionLocal, User
+from db import run_db, after_commit, User
+from access import access_cache
+from broadcast import start_broadcast
+import summary
+import analytics
 
 
 def _is_admin(context: ContextTypes.DEFAULT_TYPE, uid: int) -> bool:
     return uid in context.application.bot_data.get("ADMIN_IDS", [])
 
 
+# -------------------
+# استعلامات (تشتغل داخل run_db)
+# الكاش بيتمسح بعد الـ commit، مو قبل: وإلا check_access بيقرأ الحالة القديمة ويرجع يخزنها
+# -------------------
+def _invalidate_access(db, user_id: int):
+    after_commit(db, partial(access_cache.invalidate, user_id))
+
+
+def _activate(db, user_id: int, days: int):
+    user = db.query(User).filter(User.tg_user_id == user_id).first()
+    if not user:
+        user = User(tg_user_id=user_id)
+
+    user.is_active = True
+    user.sub_expires_at = datetime.utcnow() + timedelta(days=days)
+
+    db.add(user)
+    _invalidate_access(db, user_id)
+
+
+def _extend(db, user_id: int, days: int) -> bool:
+    user = db.query(User).filter(User.tg_user_id == user_id).first()
+    if not user:
+        return False
+
+    if not user.sub_expires_at:
+        user.sub_expires_at = datetime.utcnow()
+
+    user.sub_expires_at += timedelta(days=days)
+    _invalidate_access(db, user_id)
+    return True
+
+
+def _set_flag(db, user_id: int, **values) -> bool:
+    user = db.query(User).filter(User.tg_user_id == user_id).first()
+    if not user:
+        return False
+
+    for key, value in values.items():
+        setattr(user, key, value)
+    _invalidate_access(db, user_id)
+    return True
+
+
+def _rebuild_summaries(db) -> int:
+    return summary.rebuild(db)
+
+
 # -------------------
 # تفعيل اشتراك
 # /sub USER_ID DAYS
@@ -26,21 +79,8 @@ async def sub_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = int(context.args[0])
     days = int(context.args[1])
 
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.tg_user_id == user_id).first()
-        if not user:
-            user = User(tg_user_id=user_id)
-
-        user.is_active = True
-        user.sub_expires_at = datetime.utcnow() + timedelta(days=days)
-
-        db.add(user)
-        db.commit()
-
-        await update.message.reply_text("✅ تم تفعيل الاشتراك")
-    finally:
-        db.close()
+    await run_db(_activate, user_id, days)
+    await update.message.reply_text("✅ تم تفعيل الاشتراك")
 
 
 # -------------------
@@ -58,22 +98,11 @@ async def extend_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = int(context.args[0])
     days = int(context.args[1])
 
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.tg_user_id == user_id).first()
-        if not user:
-            await update.message.reply_text("المستخدم غير موجود")
-            return
-
-        if not user.sub_expires_at:
-            user.sub_expires_at = datetime.utcnow()
-
-        user.sub_expires_at += timedelta(days=days)
-        db.commit()
+    if not await run_db(_extend, user_id, days):
+        await update.message.reply_text("المستخدم غير موجود")
+        return
 
-        await update.message.reply_text("✅ تم التمديد")
-    finally:
-        db.close()
+    await update.message.reply_text("✅ تم التمديد")
 
 
 # -------------------
@@ -86,18 +115,10 @@ async def cancel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = int(context.args[0])
 
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.tg_user_id == user_id).first()
-        if not user:
-            return
-
-        user.is_active = False
-        db.commit()
+    if not await run_db(_set_flag, user_id, is_active=False):
+        return
 
-        await update.message.reply_text("❌ تم إلغاء الاشتراك")
-    finally:
-        db.close()
+    await update.message.reply_text("❌ تم إلغاء الاشتراك")
 
 
 # -------------------
@@ -109,17 +130,10 @@ async def ban_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = int(context.args[0])
 
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.tg_user_id == user_id).first()
-        if not user:
-            return
+    if not await run_db(_set_flag, user_id, is_blocked=True):
+        return
 
-        user.is_blocked = True
-        db.commit()
-        await update.message.reply_text("🚫 تم الحظر")
-    finally:
-        db.close()
+    await update.message.reply_text("🚫 تم الحظر")
 
 
 # -------------------
@@ -131,17 +145,10 @@ async def unban_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = int(context.args[0])
 
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.tg_user_id == user_id).first()
-        if not user:
-            return
+    if not await run_db(_set_flag, user_id, is_blocked=False):
+        return
 
-        user.is_blocked = False
-        db.commit()
-        await update.message.reply_text("✅ تم فك الحظر")
-    finally:
-        db.close()
+    await update.message.reply_text("✅ تم فك الحظر")
 
 
 # -------------------
@@ -152,48 +159,58 @@ async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     text = " ".join(context.args)
+    if not text:
+        await update.message.reply_text("الاستخدام:\n/broadcast النص")
+        return
 
-    db = SessionLocal()
-    try:
-        users = db.query(User).all()
-    finally:
-        db.close()
-
-    for u in users:
-        try:
-            await context.bot.send_message(chat_id=u.tg_user_id, text=text)
-        except:
-            pass
-
-    await update.message.reply_text("📢 تم الإرسال")
+    # الإرسال يشتغل بالخلفية ويعدّل رسالة التقدم لحاله
+    await start_broadcast(context.bot, update.effective_chat.id, text)
 
 
 # -------------------
 # إحصائيات
 # -------------------
+async def _stats_text(context: ContextTypes.DEFAULT_TYPE) -> str:
+    data, age = await analytics.get_snapshot()
+    cache = access_cache.stats()
+    text = (
+        f"{analytics.format_snapshot(data, age)}\n\n"
+        f"🗃 كاش الصلاحيات: {cache['hits']} hit / {cache['misses']} miss ({cache['size']})"
+    )
+
+    processor = context.application.update_processor
+    if hasattr(processor, "stats"):
+        q = processor.stats()
+        text += (
+            f"\n⏱ الطابور: {q['queued']} ({q['users_queued']} مستخدم، أعمق {q['max_user_depth']})"
+            f" — انتظار {q['wait_avg_ms']:.0f}ms متوسط / {q['wait_max_ms']:.0f}ms أقصى"
+        )
+    return text
+
+
 async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_admin(context, update.effective_user.id):
         return
 
-    db = SessionLocal()
-    try:
-        total = db.query(User).count()
-        active = db.query(User).filter(User.is_active == True).count()
-    finally:
-        db.close()
+    await update.message.reply_text(await _stats_text(context))
 
-    await update.message.reply_text(
-        f"👥 المستخدمين: {total}\n⭐ المشتركين: {active}"
-    )
 
+async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if not _is_admin(context, q.from_user.id):
+        return
+
+    await q.message.reply_text(await _stats_text(context))
+
+
+# -------------------
+# إعادة بناء ملخصات القائمة الرئيسية
+# /rebuild_summary
+# -------------------
+async def rebuild_summary_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(context, update.effective_user.id):
+        return
 
-def get_admin_handlers():
-    return [
-        CommandHandler("sub", sub_cmd),
-        CommandHandler("extend", extend_cmd),
-        CommandHandler("cancel", cancel_cmd),
-        CommandHandler("ban", ban_cmd),
-        CommandHandler("unban", unban_cmd),
-        CommandHandler("broadcast", broadcast_cmd),
-        CommandHandler("stats", stats_cmd),
-    ]
+    count = await run_db(_rebuild_summaries)
+    await update.message.reply_text(f"✅ تمت إعادة بناء الملخص ({count} مستخدم)")
@@ -0,0 +1,347 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from decimal import InvalidOperation
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+from sqlalchemy import insert
+
+from telegram import Update
+from telegram.ext import (
+    CommandHandler,
+    ContextTypes,
+    ConversationHandler,
+    MessageHandler,
+    filters,
+)
+
+from db import run_db, read_only, after_commit, Person, Debt
+from money import CURRENCIES, from_minor, parse_amount
+from names import normalize_name
+from people_index import people_index
+import ledger
+import summary
+
+
+# الملف بيضل بالذاكرة لحد هالحجم وبعدها بينكتب على القرص
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(4 * 1024 * 1024)))
+EXPORT_BATCH = 1000
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+IMPORT_MAX_ERRORS = 5
+
+EXPORT_FIELDS = ["person", "amount", "currency", "status", "note", "due_date", "created_at"]
+
+IMPORT_WAIT = 0
+
+# حالات الدين اللي الاستيراد بيقبلها (نفس اللي بيطلع بالتصدير)
+IMPORT_STATUSES = ("open", "paid", "written_off")
+
+
+async def _denied(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """التصدير والاستيراد أغلى شي بالبوت، فنفس فحص الاشتراك تبع الأزرار (main.check_access)."""
+    bot_data = context.application.bot_data
+    if await bot_data["check_access"](update.effective_user.id):
+        return False
+    await update.message.reply_text(bot_data["PAID_MSG"])
+    return True
+
+
+# =========================
+# تصدير
+# استعلامات (تشتغل داخل run_db)
+# =========================
+
+def _export_rows(db, uid: int):
+    """الديون مع أسماء أصحابها من cursor على السيرفر، دفعة دفعة (ما بتنحمل كلها).
+
+    amount = الباقي من الدين (amount_minor)، مو المبلغ الأصلي: للمفتوح بعد تسديد جزئي
+    هو اللي لسا عليه، وللـ paid / written_off هو اللي كان باقي وقت تسكّر.
+    """
+    rows = (
+        db.query(
+            Person.name, Debt.amount_minor, Debt.currency, Debt.status,
+            Debt.note, Debt.due_date, Debt.created_at,
+        )
+        .join(Debt, Debt.person_id == Person.id)
+        .filter(Person.owner_user_id == uid, Debt.owner_user_id == uid)
+        .order_by(Person.id, Debt.id)
+        .execution_options(yield_per=EXPORT_BATCH)
+    )
+    for name, amount_minor, currency, status, note, due_date, created_at in rows:
+        yield {
+            "person": name,
+            "amount": str(from_minor(amount_minor)),
+            "currency": currency,
+            "status": status,
+            "note": note or "",
+            "due_date": due_date.date().isoformat() if due_date else "",
+            "created_at": created_at.isoformat(sep=" ", timespec="seconds") if created_at else "",
+        }
+
+
+@read_only
+def _export(db, uid: int, fmt: str, out) -> int:
+    """يكتب الملف بـ out (binary) ويرجع عدد الديون."""
+    text = io.TextIOWrapper(out, encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="")
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(text, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for row in _export_rows(db, uid):
+            writer.writerow(row)
+            count += 1
+    else:
+        text.write("[")
+        for row in _export_rows(db, uid):
+            text.write(",\n" if count else "\n")
+            text.write(json.dumps(row, ensure_ascii=False))
+            count += 1
+        text.write("\n]\n")
+
+    text.flush()
+    text.detach()
+    return count
+
+
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if await _denied(update, context):
+        return
+
+    uid = update.effective_user.id
+    fmt = (context.args[0].lower() if context.args else "csv")
+    if fmt not in ("csv", "json"):
+        await update.message.reply_text("❗ الصيغة: /export أو /export json")
+        return
+
+    with SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as out:
+        count = await run_db(_export, uid, fmt, out)
+        if not count:
+            await update.message.reply_text("📭 ما في ديون للتصدير.")
+            return
+
+        # Telegram بيحتاج الملف كامل للرفع، بس القراءة من القاعدة كانت دفعات
+        out.seek(0)
+        await update.message.reply_document(
+            out.read(),
+            filename=f"debts-{datetime.utcnow():%Y%m%d}.{fmt}",
+            caption=f"📤 {count} دين (amount = الباقي من كل دين)",
+        )
+
+
+# =========================
+# استيراد
+# =========================
+
+def _parse_csv(data: bytes):
+    """يرجع (rows, errors). الأعمدة: name, amount, currency, status, note, due_date
+    (الأولين إجباريين). كل row هو dict جاهز للإدخال بدون owner / person_id.
+
+    status (متل التصدير) افتراضياً open؛ الـ paid / written_off بينستوردوا مسكّرين.
+    """
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # ملفات Excel العربية القديمة
+        text = data.decode("cp1256")
+
+    reader = csv.DictReader(io.StringIO(text))
+    fields = {(f or "").strip().lower(): f for f in reader.fieldnames or []}
+    columns = {
+        "name": fields.get("name") or fields.get("person") or fields.get("الاسم"),
+        "amount": fields.get("amount") or fields.get("المبلغ"),
+        "currency": fields.get("currency"),
+        "status": fields.get("status"),
+        "note": fields.get("note"),
+        "due_date": fields.get("due_date"),
+    }
+    if not columns["name"] or not columns["amount"]:
+        return [], ["أول سطر لازم يكون أسماء الأعمدة وفيه name و amount"]
+
+    rows, errors = [], []
+    for line, record in enumerate(reader, start=2):
+        def col(key):
+            return (record.get(columns[key]) or "").strip() if columns[key] else ""
+
+        name = col("name")
+        currency = col("currency").upper() or "USD"
+        status = col("status").lower() or "open"
+        due = col("due_date")
+        if not name:
+            errors.append(f"سطر {line}: الاسم فاضي")
+            continue
+        if currency not in CURRENCIES:
+            errors.append(f"سطر {line}: عملة غير معروفة {currency}")
+            continue
+        if status not in IMPORT_STATUSES:
+            errors.append(f"سطر {line}: حالة غير معروفة {status}")
+            continue
+        try:
+            amount_minor = parse_amount(col("amount"))
+        except (InvalidOperation, ValueError):
+            errors.append(f"سطر {line}: مبلغ غير صحيح")
+            continue
+        try:
+            due_date = datetime.strptime(due, "%Y-%m-%d") if due else None
+        except ValueError:
+            errors.append(f"سطر {line}: تاريخ غير صحيح (YYYY-MM-DD)")
+            continue
+
+        rows.append({
+            "name": name[:120],
+            "amount_minor": amount_minor,
+            "currency": currency,
+            "status": status,
+            "note": col("note")[:255] or None,
+            "due_date": due_date,
+        })
+    return rows, errors
+
+
+def _copy_debts(db, rows):
+    """COPY ... FROM STDIN على Postgres (psycopg2)، بنفس الـ transaction تبع الـ session."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    now = datetime.utcnow().isoformat(sep=" ")
+    for r in rows:
+        writer.writerow([
+            r["owner_user_id"], r["person_id"], r["amount_minor"], r["currency"], r["status"],
+            r["note"] if r["note"] is not None else "\\N",
+            r["due_date"].isoformat(sep=" ") if r["due_date"] else "\\N",
+            now, now,
+        ])
+    buf.seek(0)
+
+    # الـ cursor الخام ما بيمرق من RoutingSession.get_bind، فمنعلّم الكتابة لحالنا
+    db.info["wrote"] = True
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY debts (owner_user_id, person_id, amount_minor, currency, status,"
+            " note, due_date, created_at, updated_at) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buf,
+        )
+    finally:
+        cursor.close()
+
+
+def _import(db, uid: int, rows) -> int:
+    """كل الاستيراد بـ transaction وحدة: الأشخاص الناقصين دفعة وحدة، بعدين الديون."""
+    names = {}
+    for r in rows:
+        names.setdefault(normalize_name(r["name"]), r["name"])
+
+    keys = list(names)
+    person_ids = {}
+    for i in range(0, len(keys), 1000):
+        chunk = keys[i:i + 1000]
+        person_ids.update(
+            db.query(Person.name_key, Person.id)
+            .filter(Person.owner_user_id == uid, Person.name_key.in_(chunk))
+            .all()
+        )
+
+    missing = [
+        {"owner_user_id": uid, "name": names[key], "name_key": key}
+        for key in keys if key not in person_ids
+    ]
+    if missing:
+        db.execute(insert(Person), missing)
+        for i in range(0, len(missing), 1000):
+            chunk = [m["name_key"] for m in missing[i:i + 1000]]
+            person_ids.update(
+                db.query(Person.name_key, Person.id)
+                .filter(Person.owner_user_id == uid, Person.name_key.in_(chunk))
+                .all()
+            )
+
+    debts = [
+        {
+            "owner_user_id": uid,
+            "person_id": person_ids[normalize_name(r["name"])],
+            "amount_minor": r["amount_minor"],
+            "currency": r["currency"],
+            "status": r["status"],
+            "note": r["note"],
+            "due_date": r["due_date"],
+        }
+        for r in rows
+    ]
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_debts(db, debts)
+    else:
+        db.execute(insert(Debt), debts)
+    # الديون المسكّرة ما إلها رصيد، فما إلها حركة دين بالسجل
+    ledger.append_debts(db, uid, [d for d in debts if d["status"] == "open"])
+
+    summary.rebuild(db, uid)
+    # الفهرس بينبنى من جديد بالبحث الجاي
+    after_commit(db, partial(people_index.invalidate, uid))
+    return len(debts)
+
+
+async def import_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if await _denied(update, context):
+        return ConversationHandler.END
+
+    await update.message.reply_text(
+        "📥 ابعت ملف CSV، أول سطر أسماء الأعمدة:\n"
+        "name,amount,currency,status,note,due_date\n"
+        "(كلهم اختياريين غير name و amount، التاريخ YYYY-MM-DD،\n"
+        "status: open / paid / written_off، ملف /export بيمشي متل ما هو)\n"
+        "/cancel للإلغاء"
+    )
+    return IMPORT_WAIT
+
+
+async def import_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # المحادثة محفوظة، فممكن الاشتراك خلص وهي مستنية الملف
+    if await _denied(update, context):
+        return ConversationHandler.END
+
+    uid = update.effective_user.id
+    document = update.message.document
+
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text("❌ الملف كبير كتير.")
+        return ConversationHandler.END
+
+    data = bytes(await (await document.get_file()).download_as_bytearray())
+    rows, errors = _parse_csv(data)
+    if errors:
+        shown = "\n".join(errors[:IMPORT_MAX_ERRORS])
+        more = f"\n… و {len(errors) - IMPORT_MAX_ERRORS} غلط تاني" if len(errors) > IMPORT_MAX_ERRORS else ""
+        await update.message.reply_text(f"❌ ما انستورد شي، صلّح الملف وابعته مرة تانية:\n{shown}{more}")
+        return IMPORT_WAIT
+    if not rows:
+        await update.message.reply_text("📭 الملف فاضي.")
+        return ConversationHandler.END
+
+    try:
+        count = await run_db(_import, uid, rows)
+    except Exception as e:
+        print("IMPORT_ERROR:", repr(e))
+        await update.message.reply_text("❌ صار خطأ أثناء الاستيراد، ما انحفظ شي. جرّب مرة ثانية.")
+        return ConversationHandler.END
+
+    await update.message.reply_text(f"✅ انستورد {count} دين")
+    return ConversationHandler.END
+
+
+async def import_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("✅ تم إلغاء الاستيراد.")
+    return ConversationHandler.END
+
+
+def get_import_handler():
+    return ConversationHandler(
+        entry_points=[CommandHandler("import", import_start)],
+        states={
+            IMPORT_WAIT: [MessageHandler(filters.Document.ALL, import_file)],
+        },
+        fallbacks=[CommandHandler("cancel", import_cancel)],
+        name="import",
+        persistent=True,
+    )
@@ -3,14 +3,24 @@ from __future__ import annotations
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     CallbackQueryHandler,
-    CommandHandler,
     ContextTypes,
     ConversationHandler,
     MessageHandler,
     filters,
 )
 
-from db import SessionLocal, Person, Debt
+from datetime import datetime
+from decimal import InvalidOperation
+
+from sqlalchemy import func
+
+from db import run_db, read_only, Person, Debt
+from money import format_minor
+from payments import allocate_payment, parse_payment, AMBIGUOUS
+from callbacks import encode, matches
+from balances import person_balances, person_summary, format_balances
+import ledger
+import summary
 
 
 # =========================
@@ -32,6 +42,65 @@ async def _send_or_edit(update: Update, text: str, reply_markup=None, parse_mode
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
 
 
+# =========================
+# استعلامات (تشتغل داخل run_db)
+# =========================
+
+PAGE_SIZE = 20
+
+
+@read_only
+def _load_people_page(db, uid: int, before: int = None, after: int = None, limit: int = PAGE_SIZE):
+    """صفحة وحدة من الأشخاص بترتيب id تنازلي (keyset على owner_user_id, id).
+
+    before: الصفحة اللي بعد (ids أصغر من before)
+    after: الصفحة اللي قبل (ids أكبر من after)
+    يرجع (rows, has_prev, has_next) وكل row هو (id, name, balances)
+    """
+    q = db.query(Person.id, Person.name).filter(Person.owner_user_id == uid)
+
+    if after is not None:
+        rows = q.filter(Person.id > after).order_by(Person.id.asc()).limit(limit + 1).all()
+        has_prev = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        return _with_balances(db, uid, rows), has_prev, True
+
+    if before is not None:
+        q = q.filter(Person.id < before)
+
+    rows = q.order_by(Person.id.desc()).limit(limit + 1).all()
+    has_next = len(rows) > limit
+    return _with_balances(db, uid, rows[:limit]), before is not None, has_next
+
+
+def _with_balances(db, uid: int, rows):
+    balances = person_balances(db, uid, [pid for pid, _ in rows])
+    return [(pid, name, balances.get(pid, {})) for pid, name in rows]
+
+
+def _delete_debts(db, uid: int, person_id: int):
+    """شطب: الديون المفتوحة بتصير written_off وبينضاف شطب بالسجل لكل عملة.
+    ما منحذف شي حتى يضل كشف الحساب كامل."""
+    query = db.query(Debt).filter(
+        Debt.person_id == person_id,
+        Debt.owner_user_id == uid,
+        Debt.status == "open",
+    )
+
+    removed = (
+        query.with_entities(Debt.currency, func.count(), func.sum(Debt.amount_minor))
+        .group_by(Debt.currency)
+        .all()
+    )
+    if not removed:
+        return
+
+    query.update({Debt.status: "written_off", Debt.updated_at: datetime.utcnow()}, synchronize_session=False)
+    for currency, count, total in removed:
+        ledger.append(db, uid, person_id, "writeoff", currency, total)
+        summary.bump(db, uid, debts=-count, currency=currency, amount_minor=-total)
+
+
 # =========================
 # قائمة الأشخاص
 # =========================
@@ -42,29 +111,39 @@ async def list_people(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     uid = _uid(update)
 
-    db = SessionLocal()
-    try:
-        people = (
-            db.query(Person)
-            .filter(Person.owner_user_id == uid)
-            .order_by(Person.id.desc())
-            .all()
-        )
-    finally:
-        db.close()
-
-    if not people:
+    # الزر: people / people (0, id) التالي / people (1, id) السابق
+    before = after = None
+    args = context.args if update.callback_query else None
+    if args and len(args) == 2:
+        direction, cursor = args
+        if direction == 0:
+            before = cursor
+        else:
+            after = cursor
+
+    people, has_prev, has_next = await run_db(_load_people_page, uid, before, after)
+
+    if not people and before is None and after is None:
         kb = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🏠 رجوع للقائمة", callback_data="back_main")]
+            [InlineKeyboardButton("🏠 رجوع للقائمة", callback_data=encode("menu"))]
         ])
         await _send_or_edit(update, "📭 ما في أشخاص بعد.", kb)
         return
 
     rows = []
-    for p in people[:50]:
-        rows.append([InlineKeyboardButton(p.name, callback_data=f"person_{p.id}")])
+    for pid, name, balances in people:
+        label = f"{name} · {format_balances(balances)}" if balances else name
+        rows.append([InlineKeyboardButton(label, callback_data=encode("person", pid))])
+
+    nav = []
+    if has_prev and people:
+        nav.append(InlineKeyboardButton("⬅️ السابق", callback_data=encode("people", 1, people[0][0])))
+    if has_next and people:
+        nav.append(InlineKeyboardButton("التالي ➡️", callback_data=encode("people", 0, people[-1][0])))
+    if nav:
+        rows.append(nav)
 
-    rows.append([InlineKeyboardButton("🏠 رجوع للقائمة", callback_data="back_main")])
+    rows.append([InlineKeyboardButton("🏠 رجوع للقائمة", callback_data=encode("menu"))])
 
     await _send_or_edit(update, "👥 اختر شخص:", InlineKeyboardMarkup(rows))
 
@@ -78,42 +157,64 @@ async def show_person(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await q.answer()
 
     uid = _uid(update)
-    person_id = int(q.data.split("_")[1])
+    person_id = context.args[0]
 
-    db = SessionLocal()
-    try:
-        person = (
-            db.query(Person)
-            .filter(Person.id == person_id, Person.owner_user_id == uid)
-            .first()
-        )
-
-        debts = (
-            db.query(Debt)
-            .filter(Debt.person_id == person.id)
-            .all()
-        )
-    finally:
-        db.close()
-
-    if not debts:
-        text = f"👤 {person.name}\n\nلا يوجد ديون."
+    found = await run_db(person_summary, uid, person_id)
+    if not found:
+        await _send_or_edit(update, "❌ الشخص غير موجود.")
+        return
+
+    name, balances, usd_rate = found
+    if not balances:
+        text = f"👤 {name}\n\nلا يوجد ديون."
     else:
-        lines = [f"👤 {person.name}", "", "الديون:"]
-        for d in debts:
-            lines.append(f"- {d.amount:g} {d.currency}")
-        text = "\n".join(lines)
+        text = f"👤 {name}\n\nالرصيد: {format_balances(balances, usd_rate)}"
 
     kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🧾 حذف كل الديون", callback_data=f"delete_all_{person.id}")],
-        [InlineKeyboardButton("✏️ تسديد جزئي", callback_data=f"partial_{person.id}")],
-        [InlineKeyboardButton("🔙 رجوع للأشخاص", callback_data="people")],
-        [InlineKeyboardButton("🏠 رجوع للقائمة", callback_data="back_main")],
+        [InlineKeyboardButton("🧾 حذف كل الديون", callback_data=encode("delete_all", person_id))],
+        [InlineKeyboardButton("✏️ تسديد جزئي", callback_data=encode("partial", person_id))],
+        [InlineKeyboardButton("📜 كشف حساب", callback_data=encode("statement", person_id))],
+        [InlineKeyboardButton("🔙 رجوع للأشخاص", callback_data=encode("people"))],
+        [InlineKeyboardButton("🏠 رجوع للقائمة", callback_data=encode("menu"))],
     ])
 
     await _send_or_edit(update, text, kb)
 
 
+# =========================
+# كشف حساب
+# =========================
+
+_KIND_LABELS = {"debt": "➕ دين", "payment": "➖ تسديد", "writeoff": "🧾 شطب"}
+
+
+async def show_statement(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+
+    uid = _uid(update)
+    person_id = context.args[0]
+    before = context.args[1] if len(context.args) > 1 else None
+
+    rows, has_more = await run_db(ledger.statement, uid, person_id, before)
+    if not rows:
+        text = "📜 ما في حركات."
+    else:
+        lines = [
+            f"{created_at:%Y-%m-%d} {_KIND_LABELS.get(kind, kind)} "
+            f"{format_minor(abs(amount_minor))} {currency} → {format_minor(balance_after)}"
+            for _, kind, currency, amount_minor, _, created_at, balance_after in rows
+        ]
+        text = "📜 كشف حساب (الأحدث أولاً)\n\n" + "\n".join(lines)
+
+    kb = []
+    if has_more:
+        kb.append([InlineKeyboardButton("⬇️ أقدم", callback_data=encode("statement", person_id, rows[-1][0]))])
+    kb.append([InlineKeyboardButton("🔙 رجوع للشخص", callback_data=encode("person", person_id))])
+
+    await _send_or_edit(update, text, InlineKeyboardMarkup(kb))
+
+
 # =========================
 # حذف كامل
 # =========================
@@ -123,19 +224,11 @@ async def delete_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await q.answer()
 
     uid = _uid(update)
-    person_id = int(q.data.split("_")[2])
+    person_id = context.args[0]
 
-    db = SessionLocal()
-    try:
-        db.query(Debt).filter(
-            Debt.person_id == person_id,
-            Debt.owner_user_id == uid
-        ).delete()
-        db.commit()
-    finally:
-        db.close()
+    await run_db(_delete_debts, uid, person_id)
 
-    await q.edit_message_text("✅ تم حذف جميع ديون الشخص.")
+    await q.edit_message_text("✅ تم شطب جميع ديون الشخص (بتضل بكشف الحساب).")
 
 
 # =========================
@@ -148,10 +241,10 @@ async def partial_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
 
-    person_id = int(q.data.split("_")[1])
+    person_id = context.args[0]
     context.user_data["partial_person"] = person_id
 
-    await q.edit_message_text("اكتب مبلغ التسديد:")
+    await q.edit_message_text("اكتب مبلغ التسديد (مع العملة إذا عنده أكتر من عملة، مثال: 100 USD):")
     return PARTIAL_WAIT
 
 
@@ -160,52 +253,41 @@ async def partial_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     person_id = context.user_data.get("partial_person")
 
     try:
-        paid = float(update.message.text)
-    except:
+        paid_minor, currency = parse_payment(update.message.text)
+    except (InvalidOperation, ValueError):
         await update.message.reply_text("اكتب رقم صحيح")
         return PARTIAL_WAIT
 
-    db = SessionLocal()
     try:
-        debt = (
-            db.query(Debt)
-            .filter(Debt.person_id == person_id, Debt.owner_user_id == uid)
-            .first()
-        )
-
-        if not debt:
-            await update.message.reply_text("لا يوجد دين")
-            return ConversationHandler.END
-
-        debt.amount -= paid
-        if debt.amount <= 0:
-            db.delete(debt)
-
-        db.commit()
-    finally:
-        db.close()
-
-    await update.message.reply_text("✅ تم تسجيل التسديد")
+        result = await run_db(allocate_payment, uid, person_id, paid_minor, currency)
+    except Exception as e:
+        print("PARTIAL_SAVE_ERROR:", repr(e))
+        await update.message.reply_text("❌ صار خطأ أثناء تسجيل التسديد. جرّب مرة ثانية.")
+        return ConversationHandler.END
+
+    if result is AMBIGUOUS:
+        await update.message.reply_text("عنده ديون بأكتر من عملة، اكتب المبلغ مع العملة (مثال: 100 USD أو 50000 SYP)")
+        return PARTIAL_WAIT
+    if result is None:
+        await update.message.reply_text("لا يوجد دين")
+        return ConversationHandler.END
+
+    text = f"✅ تم تسجيل التسديد\nالرصيد: {format_balances(result.balances)}"
+    if result.unapplied:
+        text += f"\n⚠️ الزيادة {format_minor(result.unapplied)} {result.currency} ما انحسبت (ما في ديون بهالعملة)"
+    await update.message.reply_text(text)
     return ConversationHandler.END
 
 
 def build_partial_conv():
     return ConversationHandler(
         entry_points=[
-            CallbackQueryHandler(partial_start, pattern=r"^partial_\d+$")
+            CallbackQueryHandler(partial_start, pattern=matches("partial"))
         ],
         states={
             PARTIAL_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, partial_save)],
         },
         fallbacks=[],
+        name="partial_payment",
+        persistent=True,
     )
-
-
-def get_people_handlers():
-    return [
-        CommandHandler("people", list_people),
-        CallbackQueryHandler(list_people, pattern=r"^people$"),
-        CallbackQueryHandler(show_person, pattern=r"^person_\d+$"),
-        CallbackQueryHandler(delete_all, pattern=r"^delete_all_\d+$"),
-        build_partial_conv(),
-    ]
@@ -1,7 +1,24 @@
 from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
+from telegram.ext import ContextTypes
 
-from db import SessionLocal, User
+from db import run_db, User
+
+
+def _save_rate(db, uid: int, rate: float) -> bool:
+    """يرجع False إذا المستخدم محظور."""
+    user = db.query(User).filter(User.tg_user_id == uid).first()
+
+    # إذا المستخدم غير موجود ننشئه لكن بدون تفعيل الاشتراك
+    if not user:
+        user = User(tg_user_id=uid, is_active=False, is_blocked=False)
+        db.add(user)
+
+    # إذا محظور لا نسمح
+    if user.is_blocked:
+        return False
+
+    user.usd_rate = rate
+    return True
 
 
 async def set_rate(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -19,36 +36,15 @@ async def set_rate(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("اكتب رقم صحيح أكبر من 0")
         return
 
-    db = SessionLocal()
     try:
-        user = db.query(User).filter(User.tg_user_id == uid).first()
-
-        # إذا المستخدم غير موجود ننشئه لكن بدون تفعيل الاشتراك
-        if not user:
-            user = User(tg_user_id=uid, is_active=False, is_blocked=False)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-
-        # إذا محظور لا نسمح
-        if user.is_blocked:
-            await update.message.reply_text("🚫 أنت محظور من استخدام البوت.")
-            return
-
-        user.usd_rate = rate
-        db.commit()
-
+        saved = await run_db(_save_rate, uid, rate)
     except Exception:
         # أي خطأ بقاعدة البيانات يعطي رد بدل الصمت
         await update.message.reply_text("❌ صار خطأ أثناء حفظ السعر. جرّب مرة ثانية.")
         return
-    finally:
-        db.close()
-
-    await update.message.reply_text(f"✅ تم تحديث سعر الدولار إلى: {rate}")
 
+    if not saved:
+        await update.message.reply_text("🚫 أنت محظور من استخدام البوت.")
+        return
 
-def get_rate_handlers():
-    return [
-        CommandHandler("rate", set_rate),
-    ]
+    await update.message.reply_text(f"✅ تم تحديث سعر الدولار إلى: {rate}")
@@ -0,0 +1,29 @@
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+
+from db import run_db
+from balances import person_balances, format_balances
+from people_index import people_index
+
+
+# بحث inline: @bot اسم (لازم inline mode مفعّل من BotFather)
+RESULTS_LIMIT = 20
+
+
+async def search_results(uid: int, query: str):
+    """نتائج البحث عن أشخاص المالك مع أرصدتهم (InlineQueryResultArticle)."""
+    found = await people_index.search(uid, query, RESULTS_LIMIT)
+    if not found:
+        return []
+
+    balances = await run_db(person_balances, uid, [pid for pid, _ in found])
+
+    results = []
+    for pid, name in found:
+        balance = format_balances(balances.get(pid, {}))
+        results.append(InlineQueryResultArticle(
+            id=str(pid),
+            title=name,
+            description=f"الرصيد: {balance}",
+            input_message_content=InputTextMessageContent(f"👤 {name}\nالرصيد: {balance}"),
+        ))
+    return results
@@ -0,0 +1,192 @@
+import os
+from datetime import datetime
+
+from sqlalchemy import func, insert
+
+from db import read_only, Person, LedgerEntry, BalanceSnapshot
+
+
+# ---------------------------
+# سجل الحركات (append-only) + لقطات رصيد.
+# جدول debts بيضل الحالة الحالية (القوائم والملخص بيقروا منه)، والسجل هو التاريخ:
+# كل دين / تسديد / شطب بينضاف كصف وما بيتعدّل. كل LEDGER_SNAPSHOT_EVERY حركة
+# لشخص منكتب لقطة فيها رصيده، فالرصيد = آخر لقطة + مجموع الحركات بعدها
+# (أقل من LEDGER_SNAPSHOT_EVERY صف) مهما كبر السجل.
+# كل الدوال تشتغل داخل run_db وما تعمل commit.
+# ---------------------------
+
+LEDGER_SNAPSHOT_EVERY = int(os.getenv("LEDGER_SNAPSHOT_EVERY", "50"))
+STATEMENT_PAGE = 10
+
+KINDS = ("debt", "payment", "writeoff")
+
+
+def _lock_person(db, uid: int, person_id: int):
+    """حركات الشخص الواحد بالدور (FOR UPDATE على Postgres): هيك ترتيب الـ id
+    نفس ترتيب الوقت، واللقطة ما بتفوّت حركة لسا ما انعملها commit."""
+    db.query(Person.id).filter(
+        Person.id == person_id, Person.owner_user_id == uid
+    ).with_for_update().scalar()
+
+
+def append(db, uid: int, person_id: int, kind: str, currency: str, amount_minor: int,
+           debt_id: int = None, note: str = None) -> int:
+    """يضيف حركة ويرجع الـ id. amount_minor موجب دايماً، الإشارة من kind."""
+    if kind not in KINDS:
+        raise ValueError(kind)
+
+    _lock_person(db, uid, person_id)
+    entry = LedgerEntry(
+        owner_user_id=uid,
+        person_id=person_id,
+        debt_id=debt_id,
+        kind=kind,
+        currency=currency,
+        amount_minor=amount_minor if kind == "debt" else -amount_minor,
+        note=note,
+        created_at=datetime.utcnow(),
+    )
+    db.add(entry)
+    db.flush()
+
+    _maybe_snapshot(db, uid, person_id)
+    return entry.id
+
+
+def append_debts(db, uid: int, debts):
+    """حركات دين كتير دفعة وحدة (للاستيراد). debts: dicts فيها person_id, currency,
+    amount_minor, note. اللقطات بتنكتب مع أول حركة جاية لكل شخص."""
+    now = datetime.utcnow()
+    rows = [
+        {
+            "owner_user_id": uid,
+            "person_id": d["person_id"],
+            "debt_id": None,
+            "kind": "debt",
+            "currency": d["currency"],
+            "amount_minor": d["amount_minor"],
+            "note": d.get("note"),
+            "created_at": now,
+        }
+        for d in debts
+    ]
+    if rows:
+        db.execute(insert(LedgerEntry), rows)
+
+
+# ---------------------------
+# لقطات
+# ---------------------------
+
+def _latest_snapshot(db, uid: int, person_id: int, upto_id: int = None, as_of: datetime = None):
+    q = db.query(BalanceSnapshot.last_entry_id, BalanceSnapshot.balances).filter(
+        BalanceSnapshot.owner_user_id == uid,
+        BalanceSnapshot.person_id == person_id,
+    )
+    if upto_id is not None:
+        q = q.filter(BalanceSnapshot.last_entry_id <= upto_id)
+    if as_of is not None:
+        q = q.filter(BalanceSnapshot.taken_at <= as_of)
+
+    row = q.order_by(BalanceSnapshot.last_entry_id.desc()).first()
+    if row is None:
+        return 0, {}
+    return row[0], dict(row[1])
+
+
+def _tail(db, uid: int, person_id: int, after_id: int, upto_id: int = None, as_of: datetime = None):
+    q = db.query(LedgerEntry).filter(
+        LedgerEntry.owner_user_id == uid,
+        LedgerEntry.person_id == person_id,
+        LedgerEntry.id > after_id,
+    )
+    if upto_id is not None:
+        q = q.filter(LedgerEntry.id <= upto_id)
+    if as_of is not None:
+        q = q.filter(LedgerEntry.created_at <= as_of)
+    return q
+
+
+def _add(balances: dict, rows) -> dict:
+    result = dict(balances)
+    for currency, total in rows:
+        result[currency] = result.get(currency, 0) + int(total or 0)
+    return result
+
+
+def _maybe_snapshot(db, uid: int, person_id: int):
+    """لقطة جديدة إذا صار في LEDGER_SNAPSHOT_EVERY حركة بعد آخر لقطة."""
+    last_id, balances = _latest_snapshot(db, uid, person_id)
+    tail = _tail(db, uid, person_id, last_id)
+
+    # بس منعدّ لحد الحد: OFFSET على الـ index، مو COUNT لكل السجل
+    if tail.with_entities(LedgerEntry.id).order_by(LedgerEntry.id).offset(
+        LEDGER_SNAPSHOT_EVERY - 1
+    ).limit(1).scalar() is None:
+        return
+
+    upto_id, taken_at = tail.with_entities(
+        func.max(LedgerEntry.id), func.max(LedgerEntry.created_at)
+    ).one()
+    totals = (
+        _tail(db, uid, person_id, last_id, upto_id=upto_id)
+        .with_entities(LedgerEntry.currency, func.sum(LedgerEntry.amount_minor))
+        .group_by(LedgerEntry.currency)
+        .all()
+    )
+    db.add(BalanceSnapshot(
+        owner_user_id=uid,
+        person_id=person_id,
+        last_entry_id=upto_id,
+        taken_at=taken_at,
+        balances=_add(balances, totals),
+    ))
+    db.flush()
+
+
+# ---------------------------
+# قراءة
+# ---------------------------
+
+def balance(db, uid: int, person_id: int, as_of: datetime = None, upto_id: int = None) -> dict:
+    """{currency: minor} للشخص (هلق، أو لحد تاريخ / حركة معيّنة).
+
+    آخر لقطة قبل الحد + مجموع الحركات بعدها. العملات اللي صارت صفر بتنشال.
+    """
+    last_id, balances = _latest_snapshot(db, uid, person_id, upto_id=upto_id, as_of=as_of)
+    totals = (
+        _tail(db, uid, person_id, last_id, upto_id=upto_id, as_of=as_of)
+        .with_entities(LedgerEntry.currency, func.sum(LedgerEntry.amount_minor))
+        .group_by(LedgerEntry.currency)
+        .all()
+    )
+    return {c: v for c, v in _add(balances, totals).items() if v}
+
+
+@read_only
+def statement(db, uid: int, person_id: int, before_id: int = None, limit: int = STATEMENT_PAGE):
+    """كشف حساب من الأحدث للأقدم، صفحة صفحة بالـ id (keyset).
+
+    يرجع (rows, has_more). كل row: (id, kind, currency, amount_minor, note,
+    created_at, balance_after) و balance_after هو رصيد العملة بعد الحركة.
+    """
+    q = db.query(
+        LedgerEntry.id, LedgerEntry.kind, LedgerEntry.currency, LedgerEntry.amount_minor,
+        LedgerEntry.note, LedgerEntry.created_at,
+    ).filter(LedgerEntry.owner_user_id == uid, LedgerEntry.person_id == person_id)
+    if before_id is not None:
+        q = q.filter(LedgerEntry.id < before_id)
+
+    rows = q.order_by(LedgerEntry.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], False
+
+    # الرصيد بعد أحدث حركة بالصفحة، وبعدين منرجع لورا حركة حركة
+    running = balance(db, uid, person_id, upto_id=rows[0][0])
+    result = []
+    for entry_id, kind, currency, amount_minor, note, created_at in rows:
+        result.append((entry_id, kind, currency, amount_minor, note, created_at, running.get(currency, 0)))
+        running[currency] = running.get(currency, 0) - amount_minor
+    return result, has_more
@@ -1,24 +1,41 @@
 import os
+import threading
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.constants import ParseMode
 from telegram.ext import (
     Application,
     CommandHandler,
-    CallbackQueryHandler,
     ContextTypes,
+    InlineQueryHandler,
 )
 
-from db import init_db, SessionLocal, User
+from db import init_db, run_db, warm_pool, User
+from access import access_cache, state_of, allowed, MISSING
+from broadcast import resume_broadcasts, stop_broadcasts
+import summary
+from scheduler import UserOrderedUpdateProcessor
+from persistence import SQLPersistence
+import analytics
+import subscriptions
+import metrics
+from callbacks import CallbackRouter, encode
 
-# handlers
-from handlers.people import get_people_handlers
-from handlers.admin_panel import get_admin_handlers
-from handlers.add_debt import build_add_conversation      # ← التعديل المهم
-from handlers.rate import build_rate_conversation          # محادثة سعر الدولار
+# handlers (manifest: الـ commands والأزرار lazy، المحادثات وقت build_application)
+from handlers import COMMANDS, CONVERSATIONS, ROUTES, lazy, load
 
 TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x}
 
+# إذا WEBHOOK_URL موجود نشتغل webhook بدل polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+PORT = int(os.getenv("PORT", "8443"))
+
+# كم update بيتعالج بنفس الوقت. updates نفس المستخدم دايماً بالترتيب (scheduler.py)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+USER_QUEUE_LIMIT = int(os.getenv("USER_QUEUE_LIMIT", "50"))
+
 # ---------------------------
 # أدوات عامة
 # ---------------------------
@@ -36,41 +53,50 @@ def get_or_create_user(db, uid: int) -> User:
             is_blocked=False,
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        db.flush()
     return user
 
 
-def check_access(uid: int) -> bool:
+def _load_access(db, uid: int):
+    user = db.query(User).filter(User.tg_user_id == uid).first()
+    return state_of(user)
+
+
+def _start_user(db, uid: int):
+    return state_of(get_or_create_user(db, uid))
+
+
+async def check_access(uid: int) -> bool:
     if is_admin(uid):
         return True
 
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.tg_user_id == uid).first()
-        if not user:
-            return False
-        if getattr(user, "is_blocked", False):
-            return False
-        if not getattr(user, "is_active", False):
-            return False
-        return True
-    finally:
-        db.close()
+    state = access_cache.get(uid)
+    if state is MISSING:
+        token = access_cache.token()
+        state = await run_db(_load_access, uid)
+        access_cache.put(uid, state, token)
+    return allowed(state)
 
 
 def main_menu(uid: int) -> InlineKeyboardMarkup:
     rows = [
-        [InlineKeyboardButton("➕ إضافة دين", callback_data="add")],
-        [InlineKeyboardButton("👥 الأشخاص", callback_data="people")],
-        [InlineKeyboardButton("💱 سعر الدولار", callback_data="rate")],
-        [InlineKeyboardButton("❓ المساعدة", callback_data="help")],
+        [InlineKeyboardButton("➕ إضافة دين", callback_data=encode("add"))],
+        [InlineKeyboardButton("👥 الأشخاص", callback_data=encode("people"))],
+        [InlineKeyboardButton("💱 سعر الدولار", callback_data=encode("rate"))],
+        [InlineKeyboardButton("❓ المساعدة", callback_data=encode("help"))],
     ]
     if is_admin(uid):
-        rows.append([InlineKeyboardButton("👑 لوحة المشرف", callback_data="admin")])
+        rows.append([InlineKeyboardButton("👑 لوحة المشرف", callback_data=encode("admin"))])
     return InlineKeyboardMarkup(rows)
 
 
+async def main_menu_text(uid: int, title: str) -> str:
+    data = await run_db(summary.load, uid)
+    if data is None:
+        data = await run_db(summary.rebuild_and_load, uid)
+    return f"{title}\n\n{summary.format_summary(data)}"
+
+
 PAID_MSG = (
     "🔒 هذا البوت مدفوع.\n"
     "لا يمكنك استخدامه بدون اشتراك فعّال.\n"
@@ -90,99 +116,179 @@ HELP_TEXT = (
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    db = SessionLocal()
-    try:
-        get_or_create_user(db, uid)
-    finally:
-        db.close()
 
-    if not check_access(uid):
+    # إذا المستخدم بالكاش فهو موجود أصلاً، ما في داعي لـ get_or_create
+    state = access_cache.get(uid)
+    if state is MISSING or state is None:
+        token = access_cache.token()
+        state = await run_db(_start_user, uid)
+        access_cache.put(uid, state, token)
+
+    if not (is_admin(uid) or allowed(state)):
         await update.message.reply_text(PAID_MSG)
         return
 
     await update.message.reply_text(
-        "✅ أهلاً بك في بوت إدارة الديون",
+        await main_menu_text(uid, "✅ أهلاً بك في بوت إدارة الديون"),
         reply_markup=main_menu(uid),
     )
 
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    if not check_access(uid):
+    if not await check_access(uid):
         await update.message.reply_text(PAID_MSG)
         return
     await update.message.reply_text(HELP_TEXT)
 
 
 # ---------------------------
-# buttons
+# buttons (الصلاحية بيفحصها CallbackRouter قبل ما يوصل لهون)
 # ---------------------------
 
-async def buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def help_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
+    await q.edit_message_text(HELP_TEXT, reply_markup=InlineKeyboardMarkup([
+        [InlineKeyboardButton("🏠 رجوع للقائمة", callback_data=encode("menu"))]
+    ]))
 
-    uid = q.from_user.id
-    data = q.data
 
-    if not check_access(uid):
-        await q.message.reply_text(PAID_MSG)
-        return
+async def back_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    await q.edit_message_text(
+        await main_menu_text(q.from_user.id, "القائمة الرئيسية:"),
+        reply_markup=main_menu(q.from_user.id),
+    )
+
+
+async def admin_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+
+    keyboard = [
+        [InlineKeyboardButton("➕ تفعيل اشتراك", callback_data=encode("admin_sub"))],
+        [InlineKeyboardButton("⏳ تمديد اشتراك", callback_data=encode("admin_extend"))],
+        [InlineKeyboardButton("❌ إلغاء اشتراك", callback_data=encode("admin_cancel"))],
+        [InlineKeyboardButton("🚫 حظر مستخدم", callback_data=encode("admin_ban"))],
+        [InlineKeyboardButton("✅ فك الحظر", callback_data=encode("admin_unban"))],
+        [InlineKeyboardButton("📢 رسالة جماعية", callback_data=encode("admin_broadcast"))],
+        [InlineKeyboardButton("👥 المشتركين", callback_data=encode("admin_subscribers"))],
+        [InlineKeyboardButton("📊 الإحصائيات", callback_data=encode("admin_stats"))],
+        [InlineKeyboardButton("🏠 رجوع للقائمة", callback_data=encode("menu"))],
+    ]
+    await q.edit_message_text("👑 لوحة المشرف:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-    if data == "help":
-        await q.edit_message_text(HELP_TEXT, reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("🏠 رجوع للقائمة", callback_data="back_main")]
-        ]))
-
-    elif data == "back_main":
-        await q.edit_message_text("القائمة الرئيسية:", reply_markup=main_menu(uid))
-
-    elif data == "admin":
-        if not is_admin(uid):
-            await q.message.reply_text("🚫 هذه اللوحة للأدمن فقط.")
-            return
-
-        keyboard = [
-            [InlineKeyboardButton("➕ تفعيل اشتراك", callback_data="admin_sub")],
-            [InlineKeyboardButton("⏳ تمديد اشتراك", callback_data="admin_extend")],
-            [InlineKeyboardButton("❌ إلغاء اشتراك", callback_data="admin_cancel")],
-            [InlineKeyboardButton("🚫 حظر مستخدم", callback_data="admin_ban")],
-            [InlineKeyboardButton("✅ فك الحظر", callback_data="admin_unban")],
-            [InlineKeyboardButton("📢 رسالة جماعية", callback_data="admin_broadcast")],
-            [InlineKeyboardButton("👥 المشتركين", callback_data="admin_subscribers")],
-            [InlineKeyboardButton("📊 الإحصائيات", callback_data="admin_stats")],
-            [InlineKeyboardButton("🏠 رجوع للقائمة", callback_data="back_main")],
-        ]
-        await q.edit_message_text("👑 لوحة المشرف:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+def build_router() -> CallbackRouter:
+    """كل الأزرار من جدول واحد (callbacks.py)."""
+    router = CallbackRouter(check_access, is_admin, PAID_MSG)
+    router.add("help", help_button)
+    router.add("menu", back_main)
+    router.add("admin", admin_button, admin=True)
+    for action, (path, admin) in ROUTES.items():
+        router.add(action, lazy(path), admin=admin)
+    # بيبلّشوا محادثات (ConversationHandler بالـ group 0)
+    router.pass_through("add", "partial")
+    return router
+
+
+# ---------------------------
+# بحث inline
+# ---------------------------
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    iq = update.inline_query
+    uid = iq.from_user.id
+
+    results = []
+    if await check_access(uid):
+        results = await load("handlers.search:search_results")(uid, iq.query)
+
+    # النتائج خاصة بكل مستخدم وبتتغير مع كل دين، فما في كاش عند Telegram
+    await iq.answer(results, cache_time=0, is_personal=True)
 
 
 # ---------------------------
 # main
 # ---------------------------
 
-def main():
-    init_db()
-    app = Application.builder().token(TOKEN).build()
+async def post_init(app: Application):
+    await metrics.start()
+    await resume_broadcasts(app.bot)
+
+
+async def post_stop(app: Application):
+    await stop_broadcasts()
+    await metrics.stop()
+
+
+def build_application(request=None, concurrent_updates: int = CONCURRENT_UPDATES) -> Application:
+    """request: BaseRequest بديل (scripts/bench_replay.py بيمرّر واحد وهمي بدل Telegram)."""
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(
+            UserOrderedUpdateProcessor(concurrent_updates, per_user_limit=USER_QUEUE_LIMIT)
+        )
+        .persistence(SQLPersistence())
+        .post_init(post_init)
+        .post_stop(post_stop)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
+    app.bot_data["ADMIN_IDS"] = ADMIN_IDS   # handlers/admin_panel يقرأها من هون
+    # handlers/export_import بيفحص الصلاحية بنفس الدالة تبع الأزرار
+    app.bot_data["check_access"] = check_access
+    app.bot_data["PAID_MSG"] = PAID_MSG
+
+    # إحصائيات الأدمن تنحسب بالخلفية، /stats بيقرأ آخر لقطة
+    app.job_queue.run_repeating(analytics.refresh_job, interval=analytics.ANALYTICS_REFRESH, first=1)
+    # إيقاف الاشتراكات المنتهية + تنبيهات قرب الانتهاء
+    app.job_queue.run_repeating(
+        subscriptions.sweep_job, interval=subscriptions.EXPIRY_SWEEP_INTERVAL, first=5
+    )
+
+    # كل الأزرار: فك + فحص صلاحية مرة وحدة + جدول routes، قبل أي group تاني
+    app.add_handler(build_router(), group=-1)
 
     app.add_handler(CommandHandler("start", start), group=0)
     app.add_handler(CommandHandler("help", help_cmd), group=0)
+    app.add_handler(InlineQueryHandler(inline_search), group=0)
 
-    # المحادثات أولاً
-    app.add_handler(build_add_conversation(), group=0)
-    app.add_handler(build_rate_conversation(), group=0)
+    # المحادثات أولاً بكل group، بعدين الـ commands (handlers/__init__.py)
+    for group, path in CONVERSATIONS:
+        app.add_handler(load(path)(), group=group)
+    for group, command, path in COMMANDS:
+        app.add_handler(CommandHandler(command, lazy(path)), group=group)
 
-    # people handlers
-    for h in get_people_handlers():
-        app.add_handler(h, group=1)
+    # لازم بعد كل add_handler (latency لكل handler، استعلامات لكل update)
+    metrics.instrument(app)
 
-    # buttons العامة
-    app.add_handler(CallbackQueryHandler(buttons), group=2)
+    return app
 
-    # admin
-    for h in get_admin_handlers():
-        app.add_handler(h, group=3)
 
-    app.run_polling(drop_pending_updates=True)
+def main():
+    init_db()
+    # الـ pool بيسخن بالخلفية وقت ما PTB بيعمل initialize (getMe ...)
+    threading.Thread(target=warm_pool, name="db-warmup", daemon=True).start()
+    app = build_application()
+
+    # ما منرمي الـ updates اللي وصلت وقت الـ deploy
+    if WEBHOOK_URL:
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=False,
+        )
+    else:
+        app.run_polling(drop_pending_updates=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,319 @@
+import asyncio
+import contextvars
+import os
+import time
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from telegram.ext import (
+    ApplicationHandlerStop,
+    CallbackQueryHandler,
+    CommandHandler,
+    ConversationHandler,
+    MessageHandler,
+)
+
+from callbacks import CallbackRouter
+from access import access_cache
+
+
+# endpoint بصيغة Prometheus على METRICS_HOST:METRICS_PORT/metrics (0 = مطفي).
+# القياس نفسه دايماً شغال لأنه رخيص، الـ port بس بيحدد إذا في مين يقرأ.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+
+# ---------------------------
+# Counter / Histogram (نص Prometheus بدون مكتبة)
+# ---------------------------
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels → [counts لكل bucket، sum، count]
+
+    def observe(self, value: float, *labels):
+        item = self._values.get(labels)
+        if item is None:
+            item = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                item[0][i] += 1
+        item[1] += value
+        item[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ("le",)
+        for labels, (counts, total, count) in self._values.items():
+            for bound, n in zip(self.buckets, counts):
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {n}"
+            yield f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {count}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {count}"
+
+
+class Gauge:
+    """قيمتها بتنحسب وقت القراءة من fn (ترجع {labels: value} أو رقم)."""
+
+    def __init__(self, name: str, help: str, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def render(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Handler callback duration", ("handler", "pattern", "outcome")
+)
+UPDATE_SECONDS = Histogram("bot_update_seconds", "Whole update duration across all handler groups")
+UPDATE_QUERIES = Histogram(
+    "bot_update_db_queries", "SQL statements executed per update", buckets=COUNT_BUCKETS
+)
+DB_QUERIES = Counter("bot_db_queries_total", "SQL statements executed")
+DB_SECONDS = Histogram("bot_db_query_seconds", "SQL statement duration")
+LOOP_LAG = Histogram("bot_event_loop_lag_seconds", "How late the event loop woke up a timer")
+
+_metrics = [HANDLER_SECONDS, UPDATE_SECONDS, UPDATE_QUERIES, DB_QUERIES, DB_SECONDS, LOOP_LAG]
+
+
+def _register(metric):
+    # build_application ممكن ينعاد (scripts/bench_replay.py)، فالاسم ما بيتكرر
+    _metrics[:] = [m for m in _metrics if m.name != metric.name]
+    _metrics.append(metric)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------
+# SQL: عدد الاستعلامات لكل update
+# ---------------------------
+
+# عدّاد الـ update الحالي. run_db بينسخ الـ context للـ thread فبيوصل لهون
+_update_queries = contextvars.ContextVar("update_queries", default=None)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    DB_SECONDS.observe(time.perf_counter() - started)
+    DB_QUERIES.inc()
+    counter = _update_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def _on_error(context):
+    conn = context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+# على الكلاس: الـ primary والـ replica (بينبنوا lazily بـ db.py) بنفس العدّادات
+event.listen(Engine, "before_cursor_execute", _before_execute)
+event.listen(Engine, "after_cursor_execute", _after_execute)
+event.listen(Engine, "handle_error", _on_error)
+
+
+# ---------------------------
+# تغليف الـ handlers
+# ---------------------------
+
+def _pattern(handler) -> str:
+    if isinstance(handler, CallbackQueryHandler):
+        pattern = handler.pattern
+        return getattr(pattern, "pattern", None) or str(pattern or "")
+    if isinstance(handler, CommandHandler):
+        return ",".join(f"/{c}" for c in sorted(handler.commands))
+    if isinstance(handler, MessageHandler):
+        return "message"
+    return ""
+
+
+def _wrap(handler):
+    if isinstance(handler, ConversationHandler):
+        for inner in handler.entry_points + handler.fallbacks:
+            _wrap(inner)
+        for handlers in handler.states.values():
+            for inner in handlers:
+                _wrap(inner)
+        return
+
+    if isinstance(handler, CallbackRouter):
+        # كل route لحال بالـ latency، مو الراوتر كله كـ handler واحد
+        for action, callback in handler.routes.items():
+            handler.routes[action] = _timed(callback, getattr(callback, "__name__", action), f"cb:{action}")
+        return
+
+    callback = handler.callback
+    handler.callback = _timed(
+        callback, getattr(callback, "__name__", type(handler).__name__), _pattern(handler)
+    )
+
+
+def _timed(callback, name: str, pattern: str):
+    if getattr(callback, "_metrics_wrapped", False):
+        return callback
+
+    @wraps(callback)
+    async def timed(update, context):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            outcome = "stop"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name, pattern, outcome)
+
+    timed._metrics_wrapped = True
+    return timed
+
+
+def instrument(app):
+    """يغلّف كل الـ handlers المسجّلة و process_update. بيتنادى بعد ما تنضاف كل الـ handlers."""
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            _wrap(handler)
+
+    process_update = app.process_update
+
+    async def timed_process_update(update):
+        counter = [0]
+        token = _update_queries.set(counter)
+        started = time.perf_counter()
+        try:
+            await process_update(update)
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - started)
+            UPDATE_QUERIES.observe(counter[0])
+            _update_queries.reset(token)
+
+    # الـ fetcher ومسار الـ webhook بينادوا self.process_update
+    app.process_update = timed_process_update
+
+    processor = app.update_processor
+    if hasattr(processor, "stats"):
+        _register(Gauge(
+            "bot_update_queue", "Update scheduler state",
+            lambda: {(k,): v for k, v in processor.stats().items()}, ("field",),
+        ))
+    _register(Gauge(
+        "bot_access_cache", "Access cache counters",
+        lambda: {(k,): v for k, v in access_cache.stats().items()}, ("field",),
+    ))
+
+
+# ---------------------------
+# loop lag + HTTP endpoint
+# ---------------------------
+
+async def _watch_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+async def _serve(reader, writer):
+    try:
+        request = await reader.readline()
+        # منقرا الـ headers ومنتجاهلهم
+        while (await reader.readline()).strip():
+            pass
+
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+_server = None
+_watcher = None
+
+
+async def start():
+    global _server, _watcher
+    _watcher = asyncio.create_task(_watch_loop())
+    if METRICS_PORT:
+        _server = await asyncio.start_server(_serve, METRICS_HOST, METRICS_PORT)
+
+
+async def stop():
+    global _server, _watcher
+    if _watcher:
+        _watcher.cancel()
+        _watcher = None
+    if _server:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,199 @@
+from sqlalchemy import bindparam, inspect, literal, select, func, text
+
+from sqlalchemy.orm import Session
+
+from db import Base, SchemaVersion, OwnerSummary, Person, Debt, LedgerEntry, BalanceSnapshot
+from names import normalize_name, merge_duplicates
+import summary
+
+
+# ---------------------------
+# ترحيلات قاعدة البيانات بالترتيب.
+# create_all بينشئ الجداول الناقصة بس، ما بيضيف أعمدة ولا indexes لجدول موجود،
+# فكل تغيير على جدول موجود لازم يكون ترحيل هون برقم جديد.
+# كل ترحيل لازم يكون آمن إذا انعاد (بيفحص قبل ما يغيّر)، لأن قاعدة جديدة
+# بتنعمل بـ create_all وبعدين بتمرق عليها كل الترحيلات.
+# ---------------------------
+
+def _columns(conn, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _money_to_minor(conn):
+    """debts.amount (Float) → debts.amount_minor (BIGINT بالسنت)."""
+    columns = _columns(conn, "debts")
+    if "amount" not in columns:
+        return
+
+    if "amount_minor" not in columns:
+        conn.execute(text("ALTER TABLE debts ADD COLUMN amount_minor BIGINT"))
+    conn.execute(text(
+        "UPDATE debts SET amount_minor = CAST(ROUND(amount * 100) AS BIGINT) "
+        "WHERE amount_minor IS NULL"
+    ))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE debts ALTER COLUMN amount DROP NOT NULL"))
+        conn.execute(text("ALTER TABLE debts ALTER COLUMN amount_minor SET NOT NULL"))
+    elif conn.dialect.name == "sqlite":
+        # SQLite ما بيقدر يشيل NOT NULL عن amount، وبدونه كل INSERT جديد بيفشل
+        _rebuild_sqlite_debts(conn)
+
+    # الملخص محسوب من الديون، إذا كان بالأعمدة القديمة (Float) منمسحه وبينبنى من جديد
+    if "usd_minor" not in _columns(conn, "owner_summaries"):
+        OwnerSummary.__table__.drop(conn)
+        OwnerSummary.__table__.create(conn)
+
+
+def _rebuild_sqlite_debts(conn):
+    """جدول debts جديد بشكل الـ model (بدون amount)، نسخ الصفوف، وحذف القديم."""
+    old_columns = _columns(conn, "debts")
+    # الـ indexes بتضل مع الجدول بعد RENAME وأسماءها بتتعارض مع الجديد
+    indexes = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'debts' AND sql IS NOT NULL"
+    )).scalars().all()
+    for name in indexes:
+        conn.execute(text(f'DROP INDEX "{name}"'))
+
+    conn.execute(text("ALTER TABLE debts RENAME TO debts_old"))
+    Debt.__table__.create(conn)
+    columns = ", ".join(c.name for c in Debt.__table__.columns if c.name in old_columns)
+    conn.execute(text(f"INSERT INTO debts ({columns}) SELECT {columns} FROM debts_old"))
+    conn.execute(text("DROP TABLE debts_old"))
+
+
+def _subscription_expiry(conn):
+    if "expiry_notice_for" not in _columns(conn, "users"):
+        conn.execute(text("ALTER TABLE users ADD COLUMN expiry_notice_for TIMESTAMP"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_users_sub_expires_at ON users (sub_expires_at)"
+    ))
+
+
+def _debt_note_due_date(conn):
+    columns = _columns(conn, "debts")
+    if "note" not in columns:
+        conn.execute(text("ALTER TABLE debts ADD COLUMN note VARCHAR(255)"))
+    if "due_date" not in columns:
+        conn.execute(text("ALTER TABLE debts ADD COLUMN due_date TIMESTAMP"))
+
+
+def _composite_indexes(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_people_owner_id ON people (owner_user_id, id DESC)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_debts_owner_person ON debts (owner_user_id, person_id)"
+    ))
+    # صاروا prefix للـ indexes المركّبة
+    conn.execute(text("DROP INDEX IF EXISTS ix_people_owner_user_id"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_debts_owner_user_id"))
+
+
+def _people_name_key(conn):
+    """people.name_key + دمج المكررين + unique index على (owner_user_id, name_key)."""
+    if "name_key" not in _columns(conn, "people"):
+        conn.execute(text("ALTER TABLE people ADD COLUMN name_key VARCHAR(120)"))
+
+    # التطبيع بالبايثون (مو SQL)، على دفعات بالـ id
+    people = Person.__table__
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(people.c.id, people.c.name)
+            .where(people.c.name_key.is_(None), people.c.id > last_id)
+            .order_by(people.c.id)
+            .limit(10000)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            people.update().where(people.c.id == bindparam("pid")).values(name_key=bindparam("key")),
+            [{"pid": pid, "key": normalize_name(name)} for pid, name in rows],
+        )
+        last_id = rows[-1][0]
+
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE people ALTER COLUMN name_key SET NOT NULL"))
+
+    merged = merge_duplicates(conn)
+    if merged:
+        print(f"  merged {merged} duplicate people")
+        summary.rebuild(Session(bind=conn))
+
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_people_owner_name_key ON people (owner_user_id, name_key)"
+    ))
+
+
+def _ledger(conn):
+    """ledger_entries + balance_snapshots (create_all عملهم): كل دين مفتوح حركة
+    "debt" بمبلغه الحالي، ولقطة لكل شخص حتى ما يبلش الرصيد من جمع كل شي."""
+    entries = LedgerEntry.__table__
+    if conn.execute(select(entries.c.id).limit(1)).first() is not None:
+        return
+
+    debts = Debt.__table__
+    conn.execute(entries.insert().from_select(
+        ["owner_user_id", "person_id", "debt_id", "kind", "currency", "amount_minor", "note", "created_at"],
+        select(
+            debts.c.owner_user_id, debts.c.person_id, debts.c.id, literal("debt"),
+            debts.c.currency, debts.c.amount_minor, debts.c.note, debts.c.created_at,
+        )
+        .where(debts.c.status == "open")
+        .order_by(debts.c.created_at, debts.c.id),
+    ))
+
+    totals = conn.execute(
+        select(
+            entries.c.owner_user_id, entries.c.person_id, entries.c.currency,
+            func.sum(entries.c.amount_minor), func.max(entries.c.id), func.max(entries.c.created_at),
+        ).group_by(entries.c.owner_user_id, entries.c.person_id, entries.c.currency)
+    ).all()
+
+    snapshots = {}
+    for owner, person_id, currency, total, last_id, taken_at in totals:
+        snap = snapshots.setdefault(person_id, {
+            "owner_user_id": owner, "person_id": person_id,
+            "last_entry_id": 0, "taken_at": taken_at, "balances": {},
+        })
+        snap["balances"][currency] = int(total)
+        snap["last_entry_id"] = max(snap["last_entry_id"], last_id)
+        snap["taken_at"] = max(snap["taken_at"], taken_at)
+    if snapshots:
+        conn.execute(BalanceSnapshot.__table__.insert(), list(snapshots.values()))
+        print(f"  snapshots for {len(snapshots)} people")
+
+
+MIGRATIONS = [
+    (1, "debts.amount → amount_minor", _money_to_minor),
+    (2, "users.expiry_notice_for + index on sub_expires_at", _subscription_expiry),
+    (3, "debts.note / debts.due_date", _debt_note_due_date),
+    (4, "composite indexes on people / debts", _composite_indexes),
+    (5, "people.name_key (dedup by normalized name)", _people_name_key),
+    (6, "ledger_entries + balance_snapshots (backfill from open debts)", _ledger),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+
+def migrate(engine) -> int:
+    """يطبّق الترحيلات الناقصة ويرجع رقم النسخة. إذا محدّثة ما بيعمل غير SELECT واحد."""
+    with engine.begin() as conn:
+        version = current_version(conn)
+        if version >= LATEST:
+            return version
+
+        Base.metadata.create_all(bind=conn)
+        for number, description, apply in MIGRATIONS:
+            if number <= version:
+                continue
+            print(f"MIGRATION {number}: {description}")
+            apply(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(version=number))
+        return LATEST
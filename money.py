@@ -0,0 +1,52 @@
+import os
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+
+# كل المبالغ بتنخزن كأعداد صحيحة بأصغر وحدة (سنت / قرش): 1500.25 USD = 150025
+MINOR_PER_UNIT = 100
+CURRENCIES = ("USD", "SYP")
+
+# أكبر مبلغ منقبله (بالوحدة الكبيرة). BIGINT بيوقف عند 9.2e18 وحدة صغرى، والمجاميع
+# (summary، الرصيد) لازم كمان تساع، فالحد أقل بكتير من هيك
+MAX_AMOUNT = Decimal(os.getenv("MAX_AMOUNT", "1000000000000"))
+
+_ONE_MINOR = Decimal(1) / MINOR_PER_UNIT
+
+
+def normalize_number(text: str) -> str:
+    arabic_digits = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+    text = (text or "").strip().translate(arabic_digits)
+    # ٫ فاصلة عشرية عربية و ٬ فاصل آلاف عربي
+    text = text.replace("٫", ".").replace(",", "").replace("٬", "").replace(" ", "")
+    return text
+
+
+def to_minor(amount) -> int:
+    """Decimal/int/str → عدد صحيح بالوحدة الصغرى (تقريب نص لفوق)."""
+    value = Decimal(str(amount)).quantize(_ONE_MINOR, rounding=ROUND_HALF_UP)
+    return int(value * MINOR_PER_UNIT)
+
+
+def from_minor(minor) -> Decimal:
+    return Decimal(int(minor or 0)) / MINOR_PER_UNIT
+
+
+def parse_amount(text: str) -> int:
+    """نص من المستخدم (1500 / 1,500 / ١٥٠٠ / 12.5) → مبلغ موجب بالوحدة الصغرى.
+
+    يرفع InvalidOperation إذا النص مو رقم أو المبلغ <= 0، و ValueError إذا أكبر من MAX_AMOUNT.
+    """
+    amount = Decimal(normalize_number(text))
+    if not amount.is_finite():
+        raise InvalidOperation
+    if amount > MAX_AMOUNT:
+        raise ValueError("amount too large")
+    minor = to_minor(amount)
+    if minor <= 0:
+        raise InvalidOperation
+    return minor
+
+
+def format_minor(minor) -> str:
+    text = f"{from_minor(minor):,.2f}"
+    return text.rstrip("0").rstrip(".")
@@ -0,0 +1,118 @@
+import re
+import unicodedata
+
+from sqlalchemy import and_, bindparam, func, literal_column, select
+
+from db import Person, Debt
+
+
+# تشكيل وعلامات قرآنية وتطويل (ـ): ما بتغيّر الاسم
+_ARABIC_MARKS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+
+# أشكال الحرف الوحدة اللي الناس بتكتبها بدل بعض
+_LETTERS = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+})
+
+NAME_KEY_LENGTH = 120
+
+
+def normalize_name(name: str) -> str:
+    """مفتاح المقارنة للاسم: "أحمد  علي" و "احمد علي" و "AHMAD" / "ahmad" نفس الشخص."""
+    text = unicodedata.normalize("NFKC", name or "")
+    text = _ARABIC_MARKS.sub("", text)
+    text = text.translate(_LETTERS).casefold()
+    return " ".join(text.split())[:NAME_KEY_LENGTH]
+
+
+# ---------------------------
+# استعلامات (تشتغل داخل run_db)
+# ---------------------------
+
+def upsert_person(db, uid: int, name: str):
+    """يرجع (person_id, created): الشخص الموجود بنفس الاسم المطبّع أو واحد جديد.
+
+    على Postgres استعلام واحد (ON CONFLICT DO UPDATE ... RETURNING)، على SQLite
+    ON CONFLICT DO NOTHING وإذا ما رجع شي منقرا الموجود.
+    """
+    # الـ dialects هون مو فوق: استيرادهم تقيل وما بيلزموا قبل أول دين
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    key = normalize_name(name)
+    values = {"owner_user_id": uid, "name": name, "name_key": key}
+    conflict = [Person.owner_user_id, Person.name_key]
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        stmt = postgresql.insert(Person).values(values)
+        # الـ update الفاضي بس حتى RETURNING يرجع الصف الموجود؛ xmax = 0 يعني انضاف هلق
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict, set_={"name_key": stmt.excluded.name_key}
+        ).returning(Person.id, literal_column("(xmax = 0)"))
+        person_id, created = db.execute(stmt).one()
+        return person_id, bool(created)
+
+    if dialect == "sqlite":
+        stmt = sqlite.insert(Person).values(values).on_conflict_do_nothing(index_elements=conflict)
+        person_id = db.execute(stmt.returning(Person.id)).scalar()
+        if person_id is not None:
+            return person_id, True
+
+    person_id = db.query(Person.id).filter(
+        Person.owner_user_id == uid, Person.name_key == key
+    ).scalar()
+    if person_id is not None:
+        return person_id, False
+
+    person = Person(**values)
+    db.add(person)
+    db.flush()
+    return person.id, True
+
+
+def merge_duplicates(conn) -> int:
+    """يدمج الأشخاص المكررين (نفس المالك ونفس name_key) بأقدم واحد فيهم.
+
+    الديون بتنتقل للأقدم والباقي بينحذف، كله بـ executemany. يرجع عدد المحذوفين.
+    بعدها لازم summary.rebuild لأن عدد الأشخاص تغيّر.
+    """
+    people = Person.__table__
+    debts = Debt.__table__
+
+    groups = (
+        select(
+            people.c.owner_user_id,
+            people.c.name_key,
+            func.min(people.c.id).label("keep"),
+        )
+        .group_by(people.c.owner_user_id, people.c.name_key)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    moves = [
+        {"dup": dup, "keep": keep}
+        for dup, keep in conn.execute(
+            select(people.c.id, groups.c.keep)
+            .join(groups, and_(
+                people.c.owner_user_id == groups.c.owner_user_id,
+                people.c.name_key == groups.c.name_key,
+            ))
+            .where(people.c.id != groups.c.keep)
+        )
+    ]
+    if not moves:
+        return 0
+
+    conn.execute(
+        debts.update()
+        .where(debts.c.person_id == bindparam("dup"))
+        .values(person_id=bindparam("keep")),
+        moves,
+    )
+    conn.execute(people.delete().where(people.c.id == bindparam("dup")), moves)
+    return len(moves)
@@ -0,0 +1,105 @@
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from db import Debt
+from money import parse_amount
+from balances import person_balances
+import ledger
+import summary
+
+
+# نتيجة تسديد: applied = اللي انخصم، unapplied = الزيادة عن كل الديون المفتوحة،
+# closed = كم دين تسكّر، balances = رصيد الشخص بعد التسديد {currency: minor}
+Payment = namedtuple("Payment", "currency applied unapplied closed balances")
+
+# الشخص عنده ديون بأكتر من عملة والمستخدم ما حدد
+AMBIGUOUS = "ambiguous"
+
+_CURRENCY_WORDS = {
+    "usd": "USD", "$": "USD", "دولار": "USD",
+    "syp": "SYP", "ل.س": "SYP", "ليرة": "SYP", "ليره": "SYP",
+}
+_AMOUNT_CURRENCY = re.compile(r"^\s*(.*?)\s*(usd|\$|دولار|syp|ل\.س|ليرة|ليره)?\s*$", re.IGNORECASE)
+
+
+def parse_payment(text: str):
+    """"100" / "100 USD" / "100 ليرة" → (amount_minor, currency أو None).
+
+    يرفع InvalidOperation / ValueError متل parse_amount.
+    """
+    match = _AMOUNT_CURRENCY.match(text or "")
+    amount, word = match.group(1), match.group(2)
+    return parse_amount(amount), _CURRENCY_WORDS[word.lower()] if word else None
+
+
+# ---------------------------
+# استعلامات (تشتغل داخل run_db)
+# ---------------------------
+
+def allocate_payment(db, uid: int, person_id: int, paid_minor: int, currency: str = None):
+    """يوزّع التسديد على ديون الشخص المفتوحة بنفس العملة، الأقدم أولاً.
+
+    الديون بتنقفل بـ FOR UPDATE (على Postgres) فتسديدين بنفس الوقت ما بيضيّعوا
+    بعض. الديون اللي تسكّرت بتصير status = "paid" بـ UPDATE واحد، والدين اللي
+    انخصم منه جزء بـ UPDATE تاني، والتسديد كله حركة وحدة بالسجل (ledger.py).
+
+    يرجع Payment، أو None إذا ما في ديون مفتوحة،
+    أو AMBIGUOUS إذا ما في عملة والشخص عنده أكتر من عملة.
+    """
+    open_debts = db.query(Debt).filter(
+        Debt.owner_user_id == uid,
+        Debt.person_id == person_id,
+        Debt.status == "open",
+    )
+
+    if currency is None:
+        currencies = [c for (c,) in open_debts.with_entities(Debt.currency).distinct().all()]
+        if not currencies:
+            return None
+        if len(currencies) > 1:
+            return AMBIGUOUS
+        currency = currencies[0]
+
+    debts = (
+        open_debts.filter(Debt.currency == currency)
+        .with_entities(Debt.id, Debt.amount_minor)
+        .order_by(Debt.created_at, Debt.id)
+        .with_for_update()
+        .all()
+    )
+    if not debts:
+        return None
+
+    remaining = paid_minor
+    closed = []
+    partial = None
+    for debt_id, amount_minor in debts:
+        if remaining <= 0:
+            break
+        if amount_minor <= remaining:
+            closed.append(debt_id)
+            remaining -= amount_minor
+        else:
+            partial = (debt_id, remaining)
+            remaining = 0
+
+    now = datetime.utcnow()
+    if closed:
+        db.query(Debt).filter(Debt.id.in_(closed)).update(
+            {Debt.status: "paid", Debt.updated_at: now}, synchronize_session=False
+        )
+    if partial:
+        debt_id, take = partial
+        db.query(Debt).filter(Debt.id == debt_id).update(
+            {Debt.amount_minor: Debt.amount_minor - take, Debt.updated_at: now},
+            synchronize_session=False,
+        )
+
+    applied = paid_minor - remaining
+    ledger.append(db, uid, person_id, "payment", currency, applied)
+    summary.bump(db, uid, debts=-len(closed), currency=currency, amount_minor=-applied)
+
+    balances = person_balances(db, uid, [person_id]).get(person_id, {})
+    return Payment(currency, applied, remaining, len(closed), balances)
+
@@ -0,0 +1,168 @@
+import asyncio
+import os
+from bisect import bisect_left
+from collections import OrderedDict
+
+from db import run_db, read_only, Person
+from names import normalize_name
+
+
+# كم مالك منحفظ فهرسه بالذاكرة (LRU)، وأكبر فهرس منقبل نبنيه
+SEARCH_INDEX_OWNERS = int(os.getenv("SEARCH_INDEX_OWNERS", "2000"))
+SEARCH_INDEX_MAX_PEOPLE = int(os.getenv("SEARCH_INDEX_MAX_PEOPLE", "200000"))
+
+
+def _tokens(key: str):
+    """كل لاحقة بتبلش ببداية كلمة: "ahmad ali" → "ahmad ali", "ali"."""
+    yield key
+    for i, ch in enumerate(key):
+        if ch == " ":
+            yield key[i + 1:]
+
+
+class OwnerIndex:
+    """أسماء أشخاص مالك واحد كقائمة مرتبة، والبحث بالبادئة بـ bisect."""
+
+    def __init__(self, people=()):
+        pairs = sorted(
+            (token, pid) for pid, _, key in people for token in _tokens(key)
+        )
+        self.keys = [token for token, _ in pairs]
+        self.ids = [pid for _, pid in pairs]
+        self.names = {pid: name for pid, name, _ in people}
+
+    def add(self, person_id: int, name: str, key: str):
+        if person_id in self.names:
+            return
+        self.names[person_id] = name
+        for token in _tokens(key):
+            i = bisect_left(self.keys, token)
+            self.keys.insert(i, token)
+            self.ids.insert(i, person_id)
+
+    def search(self, prefix: str, limit: int):
+        """[(person_id, name)] للأشخاص اللي اسمهم أو كلمة منه بتبلش بـ prefix."""
+        found = []
+        seen = set()
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            pid = self.ids[i]
+            if pid not in seen:
+                seen.add(pid)
+                found.append((pid, self.names[pid]))
+                if len(found) >= limit:
+                    break
+            i += 1
+        return found
+
+
+# ---------------------------
+# استعلامات (تشتغل داخل run_db)
+# ---------------------------
+
+@read_only
+def _load_people(db, uid: int, limit: int):
+    """(id, name, name_key) لكل أشخاص المالك، أو None إذا أكتر من limit."""
+    rows = (
+        db.query(Person.id, Person.name, Person.name_key)
+        .filter(Person.owner_user_id == uid)
+        .limit(limit + 1)
+        .all()
+    )
+    if len(rows) > limit:
+        return None
+    return [tuple(row) for row in rows]
+
+
+@read_only
+def _search_sql(db, uid: int, prefix: str, limit: int):
+    """البحث من القاعدة: range على الـ unique index (owner_user_id, name_key).
+
+    بادئة الاسم كامل بس (مو كل كلمة)، الـ LIKE للتأكيد والـ range حتى ينستعمل الـ index.
+    """
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    rows = (
+        db.query(Person.id, Person.name)
+        .filter(
+            Person.owner_user_id == uid,
+            Person.name_key >= prefix,
+            Person.name_key < prefix + "\uffff",
+            Person.name_key.like(pattern, escape="\\"),
+        )
+        .order_by(Person.name_key)
+        .limit(limit)
+        .all()
+    )
+    return [tuple(row) for row in rows]
+
+
+# ---------------------------
+# الكاش
+# ---------------------------
+
+class PeopleIndex:
+    """فهرس لكل مالك بينبنى بالخلفية أول ما يبحث؛ لحد ما يجهز البحث من SQL.
+
+    يشتغل فقط من الـ event loop. الكتابات بتنادي add بعد الـ commit (db.after_commit
+    بـ add_debt._save_debt)؛ إذا إجت كتابة وقت التحميل منرمي النتيجة حتى ما يضيع
+    الشخص الجديد، وبتنبنى بالبحث الجاي.
+    """
+
+    def __init__(self, max_owners: int, max_people: int):
+        self.max_owners = max_owners
+        self.max_people = max_people
+        self._owners = OrderedDict()
+        self._loading = {}   # uid → task
+        self._stale = set()  # انكتب عليهم وقت التحميل
+        self._too_big = set()
+
+    async def search(self, uid: int, query: str, limit: int = 20):
+        prefix = normalize_name(query)
+        if not prefix:
+            return []
+
+        index = self._owners.get(uid)
+        if index is not None:
+            self._owners.move_to_end(uid)
+            return index.search(prefix, limit)
+
+        if uid not in self._too_big and uid not in self._loading:
+            self._loading[uid] = asyncio.create_task(self._load(uid))
+        return await run_db(_search_sql, uid, prefix, limit)
+
+    async def _load(self, uid: int):
+        self._stale.discard(uid)
+        try:
+            people = await run_db(_load_people, uid, self.max_people)
+        finally:
+            del self._loading[uid]
+
+        if people is None:
+            self._too_big.add(uid)
+            return
+        if uid in self._stale:
+            self._stale.discard(uid)
+            return
+
+        self._owners[uid] = OwnerIndex(people)
+        while len(self._owners) > self.max_owners:
+            self._owners.popitem(last=False)
+
+    def add(self, uid: int, person_id: int, name: str):
+        index = self._owners.get(uid)
+        if index is not None:
+            index.add(person_id, name, normalize_name(name))
+        elif uid in self._loading:
+            self._stale.add(uid)
+
+    def invalidate(self, uid: int):
+        self._owners.pop(uid, None)
+        if uid in self._loading:
+            self._stale.add(uid)
+
+    def clear(self):
+        self._owners.clear()
+        self._too_big.clear()
+
+
+people_index = PeopleIndex(SEARCH_INDEX_OWNERS, SEARCH_INDEX_MAX_PEOPLE)
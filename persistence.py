@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from access import AccessCache, MISSING
+from db import run_db, BotUserData, BotConversation
+
+
+# كل كم ثانية PTB بيسلّمنا التغييرات، وكل كم ثانية/كم عنصر منكتبهم بالقاعدة
+PERSIST_UPDATE_INTERVAL = float(os.getenv("PERSIST_UPDATE_INTERVAL", "5"))
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "10"))
+PERSIST_FLUSH_SIZE = int(os.getenv("PERSIST_FLUSH_SIZE", "200"))
+# كم مستخدم منتذكر إنه user_data تبعه انقرت (LRU)؛ اللي بيطلع منها بينقرا مرة تانية
+PERSIST_LOADED_USERS = int(os.getenv("PERSIST_LOADED_USERS", "10000"))
+
+
+# ---------------------------
+# استعلامات (تشتغل داخل run_db)
+# ---------------------------
+
+def _load_user_data(db, user_id: int):
+    row = db.query(BotUserData.data).filter(BotUserData.user_id == user_id).first()
+    return row[0] if row else None
+
+
+def _load_conversations(db, name: str) -> dict:
+    rows = db.query(BotConversation.key, BotConversation.state).filter(BotConversation.name == name).all()
+    return {tuple(json.loads(key)): state for key, state in rows}
+
+
+def _write(db, users: dict, conversations: dict):
+    """كتابة دفعة وحدة: حذف الصفوف القديمة وإدخال الجديدة بـ executemany."""
+    if users:
+        db.query(BotUserData).filter(BotUserData.user_id.in_(list(users))).delete(
+            synchronize_session=False
+        )
+        rows = [{"user_id": uid, "data": data} for uid, data in users.items() if data]
+        if rows:
+            db.bulk_insert_mappings(BotUserData, rows)
+
+    for name in {name for name, _ in conversations}:
+        keys = [key for n, key in conversations if n == name]
+        db.query(BotConversation).filter(
+            BotConversation.name == name, BotConversation.key.in_(keys)
+        ).delete(synchronize_session=False)
+
+    # المحادثات اللي خلصت (state = None) بتنحذف بس
+    rows = [
+        {"name": name, "key": key, "state": state}
+        for (name, key), state in conversations.items()
+        if state is not None
+    ]
+    if rows:
+        db.bulk_insert_mappings(BotConversation, rows)
+
+
+class SQLPersistence(BasePersistence):
+    """Persistence على نفس قاعدة البيانات، write-behind.
+
+    - user_data بتنقرا lazily: أول update لكل مستخدم بيجيب بياناته (refresh_user_data)
+    - المحادثات المفتوحة بتنقرا مرة وحدة عند التشغيل (صغيرة، لأن الخالصة بتنحذف)
+    - التغييرات بتنجمع بالذاكرة وبتنكتب دفعة وحدة كل PERSIST_FLUSH_INTERVAL ثانية
+      أو لما يتجمع PERSIST_FLUSH_SIZE عنصر، مو كتابة مع كل رسالة
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = PERSIST_FLUSH_INTERVAL,
+        flush_size: int = PERSIST_FLUSH_SIZE,
+        update_interval: float = PERSIST_UPDATE_INTERVAL,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+
+        # نفس كاش LRU تبع الصلاحيات، بدون TTL
+        self._loaded_users = AccessCache(maxsize=PERSIST_LOADED_USERS, ttl=float("inf"))
+        self._dirty_users = {}
+        self._dirty_conversations = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer = None
+        self._flush_tasks = set()  # منحتفظ فيهم حتى ما ينمسحوا بالنص (GC)
+
+    # ---------- قراءة ----------
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str):
+        return await run_db(_load_conversations, name)
+
+    async def refresh_user_data(self, user_id: int, user_data) -> None:
+        if self._loaded_users.get(user_id) is not MISSING:
+            return
+        # بيانات بالذاكرة أحدث من القاعدة (setdefault تحت)، فإعادة القراءة بعد الطرد آمنة؛
+        # بس إذا في تغييرات لسا ما انكتبت، القاعدة ممكن ترجّع مفتاح انحذف
+        self._loaded_users.put(user_id, True)
+        if user_id in self._dirty_users:
+            return
+
+        stored = await run_db(_load_user_data, user_id)
+        for key, value in (stored or {}).items():
+            user_data.setdefault(key, value)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    # ---------- كتابة (بالذاكرة، والـ flush بيكتب) ----------
+
+    async def update_user_data(self, user_id: int, data) -> None:
+        self._dirty_users[user_id] = dict(data)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty_users[user_id] = None
+        self._schedule_flush()
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        self._dirty_conversations[(name, json.dumps(list(key)))] = new_state
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    def _schedule_flush(self):
+        if len(self._dirty_users) + len(self._dirty_conversations) >= self.flush_size:
+            self._spawn_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                self.flush_interval, self._spawn_flush
+            )
+
+    def _spawn_flush(self):
+        task = asyncio.get_running_loop().create_task(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self) -> None:
+        """PTB بيناديها وقت الإيقاف: بتستنى الـ flush اللي شغالين وبتكتب الباقي."""
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self._flush()
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            users, self._dirty_users = self._dirty_users, {}
+            conversations, self._dirty_conversations = self._dirty_conversations, {}
+            if not users and not conversations:
+                return
+
+            try:
+                await run_db(_write, users, conversations)
+            except Exception as e:
+                # نرجعهم للدفعة الجاية بدون ما نكتب فوق تغييرات أحدث
+                print("PERSISTENCE_FLUSH_ERROR:", repr(e))
+                for uid, data in users.items():
+                    self._dirty_users.setdefault(uid, data)
+                for key, state in conversations.items():
+                    self._dirty_conversations.setdefault(key, state)
+                self._schedule_flush()
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from db import unit_of_work
+
+
+def _user_key(update):
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """يعالج updates مستخدمين مختلفين بالتوازي، وupdates نفس المستخدم بالترتيب.
+
+    - workers: كم update بيشتغل فعلياً بنفس الوقت
+    - max_pending: الحد الكلي للـ updates المستنية بالذاكرة (الـ semaphore تبع PTB)
+    - per_user_limit: أقصى طابور لمستخدم واحد، الزيادة بتنرمى
+
+    كل مستخدم إله سلسلة futures: كل update بيستنى اللي قبله يخلص،
+    فالمحادثات (ASK_NAME → ASK_AMOUNT، التسديد الجزئي) ما بتتسابق.
+    """
+
+    def __init__(self, workers: int, max_pending: int = None, per_user_limit: int = 50):
+        super().__init__(max_pending or workers * 50)
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self._worker_slots = asyncio.Semaphore(workers)
+        self._tails = {}
+        self._depth = {}
+
+        self.processed = 0
+        self.dropped = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update, coroutine) -> None:
+        queued = time.monotonic()
+        key = _user_key(update)
+        if key is None:
+            await self._run(coroutine, queued, None)
+            return
+
+        depth = self._depth.get(key, 0)
+        if depth >= self.per_user_limit:
+            coroutine.close()
+            self.dropped += 1
+            return
+
+        self._depth[key] = depth + 1
+        prev = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+
+        try:
+            if prev is not None:
+                # wait بدل await حتى إلغاء هالمهمة ما يلغي الـ future تبع اللي قبلها
+                await asyncio.wait([prev])
+            await self._run(coroutine, queued, key)
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+            if self._depth[key] <= 1:
+                del self._depth[key]
+            else:
+                self._depth[key] -= 1
+
+    async def _run(self, coroutine, queued: float, key):
+        async with self._worker_slots:
+            waited = time.monotonic() - queued
+            self.processed += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            # كل الـ handler groups لهالـ update بيشاركوا session وحدة (commit مع كل كتابة)
+            async with unit_of_work(key):
+                await coroutine
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "users_queued": len(self._depth),
+            "queued": sum(self._depth.values()),
+            "max_user_depth": max(self._depth.values(), default=0),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "wait_avg_ms": 1000 * self.wait_total / self.processed if self.processed else 0.0,
+            "wait_max_ms": 1000 * self.wait_max,
+        }
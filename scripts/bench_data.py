@@ -0,0 +1,290 @@
+"""Benchmark لمسار البيانات تبع الـ handlers على قاعدة فيها بيانات كتيرة.
+
+    python scripts/bench_data.py --url sqlite:////tmp/bench.db --people 100000
+    python scripts/bench_data.py --url postgresql://localhost/bench --people 1000000 --out bench.json
+
+بيعبّي القاعدة (إذا فاضية) بمالكين وأشخاص وديون بتوزيع مايل (قلة من المالكين
+عندهم أغلب الأشخاص، متل الواقع)، وبعدين بيشغّل دوال البيانات تبع كل handler
+وبيطلع p50/p99 وعدد الاستعلامات وعدد الصفوف لكل عملية، وبيكتبهم JSON.
+
+ما تشغّله على قاعدة الإنتاج: العمليات بتكتب وبتمسح.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///bench.db", help="قاعدة البيانات تبع الـ benchmark")
+    parser.add_argument("--owners", type=int, default=1000)
+    parser.add_argument("--people", type=int, default=10000)
+    parser.add_argument("--debts-per-person", type=float, default=3.0, help="المتوسط")
+    parser.add_argument("--skew", type=float, default=1.1, help="أس Zipf لتوزيع الأشخاص على المالكين")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_data.json")
+    return parser.parse_args()
+
+
+ARGS = _parse_args()
+
+# db.py بيقرأ DATABASE_URL وقت الـ import، فلازم نحطها قبل
+os.environ["DATABASE_URL"] = ARGS.url
+
+from sqlalchemy import create_engine, event, func, insert, text
+from sqlalchemy.orm import Session
+
+import db
+from db import User, Person, Debt
+import main
+import analytics
+import payments
+import summary
+from balances import person_summary
+from handlers import add_debt, people
+
+
+# ---------------------------
+# عدّاد الاستعلامات والصفوف
+# ---------------------------
+
+COUNTS = {"queries": 0, "rows": 0}
+
+
+def _counting(cursor_cls):
+    """cursor بيعدّ الصفوف اللي بتنقرا منه."""
+    class CountingCursor(cursor_cls):
+        def fetchone(self):
+            row = super().fetchone()
+            if row is not None:
+                COUNTS["rows"] += 1
+            return row
+
+        def fetchmany(self, *args, **kwargs):
+            rows = super().fetchmany(*args, **kwargs)
+            COUNTS["rows"] += len(rows)
+            return rows
+
+        def fetchall(self):
+            rows = super().fetchall()
+            COUNTS["rows"] += len(rows)
+            return rows
+
+    return CountingCursor
+
+
+def _bench_engine():
+    """engine على نفس القاعدة بس بـ cursor بيعدّ (sqlite3 و psycopg2)."""
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        import sqlite3
+
+        cursor_cls = _counting(sqlite3.Cursor)
+
+        class CountingConnection(sqlite3.Connection):
+            def cursor(self, factory=cursor_cls):
+                return super().cursor(factory)
+
+        connect_args = {"factory": CountingConnection}
+    elif dialect == "postgresql":
+        import psycopg2.extensions
+
+        connect_args = {"cursor_factory": _counting(psycopg2.extensions.cursor)}
+    else:
+        connect_args = {}
+
+    engine = create_engine(db.DATABASE_URL, connect_args=connect_args)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        COUNTS["queries"] += 1
+
+    return engine
+
+
+# ---------------------------
+# تعبئة البيانات
+# ---------------------------
+
+BATCH = 10000
+
+
+def _owner_weights(n: int, skew: float):
+    return [1.0 / (i + 1) ** skew for i in range(n)]
+
+
+def _insert_batches(conn, model, rows):
+    for i in range(0, len(rows), BATCH):
+        conn.execute(insert(model), rows[i:i + BATCH])
+
+
+def seed(engine, rng: random.Random):
+    with Session(engine) as s:
+        if s.query(func.count(Person.id)).scalar():
+            print("القاعدة فيها بيانات، منستعملها متل ما هي")
+            return
+
+    print(f"تعبئة: {ARGS.owners} مالك، {ARGS.people} شخص ...")
+    started = time.perf_counter()
+    owners = [1_000_000 + i for i in range(ARGS.owners)]
+    person_owner = rng.choices(owners, weights=_owner_weights(ARGS.owners, ARGS.skew), k=ARGS.people)
+
+    with engine.begin() as conn:
+        _insert_batches(conn, User, [
+            {"tg_user_id": uid, "is_active": True, "is_blocked": False, "usd_rate": 14000.0}
+            for uid in owners
+        ])
+        _insert_batches(conn, Person, [
+            {"id": i + 1, "owner_user_id": uid, "name": f"person {i + 1}", "name_key": f"person {i + 1}"}
+            for i, uid in enumerate(person_owner)
+        ])
+
+        debts = []
+        for i, uid in enumerate(person_owner):
+            # عدد الديون كمان مايل: أغلب الأشخاص عندهم دين أو اتنين وقلة عندهم كتير
+            for _ in range(min(int(rng.expovariate(1 / ARGS.debts_per_person)) + 1, 200)):
+                debts.append({
+                    "id": len(debts) + 1,
+                    "owner_user_id": uid,
+                    "person_id": i + 1,
+                    "amount_minor": rng.randint(100, 1_000_000),
+                    "currency": "USD" if rng.random() < 0.8 else "SYP",
+                    "status": "open",
+                })
+        _insert_batches(conn, Debt, debts)
+
+        if conn.dialect.name == "postgresql":
+            for table in ("people", "debts"):
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+                ))
+
+    with Session(engine) as s:
+        summary.rebuild(s)
+        s.commit()
+
+    print(f"  {len(debts)} دين، {time.perf_counter() - started:.1f} ثانية")
+
+
+# ---------------------------
+# العمليات
+# ---------------------------
+
+def _operations(engine, rng: random.Random):
+    """كل عملية بترجع (الدالة، الـ args) بالنسبة لمالك وشخص عشوائيين حسب نفس التوزيع."""
+    with Session(engine) as s:
+        pairs = s.query(Person.owner_user_id, Person.id).all()
+
+    def pick():
+        return rng.choice(pairs)
+
+    def list_people():
+        uid, _ = pick()
+        return people._load_people_page, (uid,)
+
+    def show_person():
+        uid, pid = pick()
+        return person_summary, (uid, pid)
+
+    def save_debt():
+        uid, _ = pick()
+        return add_debt._save_debt, (uid, "bench", rng.randint(100, 100_000))
+
+    def partial_save():
+        uid, pid = pick()
+        return payments.allocate_payment, (uid, pid, rng.randint(100, 10_000))
+
+    def delete_all():
+        uid, pid = pick()
+        return people._delete_debts, (uid, pid)
+
+    def check_access():
+        uid, _ = pick()
+        return main._load_access, (uid,)
+
+    def main_menu():
+        uid, _ = pick()
+        return summary.load, (uid,)
+
+    def stats_cmd():
+        return analytics._collect, ()
+
+    return {
+        "check_access": check_access,
+        "main_menu": main_menu,
+        "list_people": list_people,
+        "show_person": show_person,
+        "save_debt": save_debt,
+        "partial_save": partial_save,
+        "delete_all": delete_all,
+        "stats_cmd": stats_cmd,
+    }
+
+
+def _percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def run(engine, rng: random.Random) -> dict:
+    results = {}
+    for name, make in _operations(engine, rng).items():
+        timings, queries, rows = [], 0, 0
+        for _ in range(ARGS.iterations):
+            fn, args = make()
+            COUNTS["queries"] = COUNTS["rows"] = 0
+            # نفس اللي بيعمله run_db: session جديدة لكل استدعاء
+            started = time.perf_counter()
+            with Session(engine) as s:
+                fn(s, *args)
+                s.commit()
+            timings.append((time.perf_counter() - started) * 1000)
+            queries += COUNTS["queries"]
+            rows += COUNTS["rows"]
+
+        results[name] = {
+            "n": len(timings),
+            "p50_ms": round(_percentile(timings, 0.50), 3),
+            "p99_ms": round(_percentile(timings, 0.99), 3),
+            "mean_ms": round(sum(timings) / len(timings), 3),
+            "queries_per_op": round(queries / len(timings), 2),
+            "rows_per_op": round(rows / len(timings), 2),
+        }
+        r = results[name]
+        print(f"{name:<14} p50 {r['p50_ms']:>9.3f}ms  p99 {r['p99_ms']:>9.3f}ms  "
+              f"queries {r['queries_per_op']:>5}  rows {r['rows_per_op']:>7}")
+    return results
+
+
+def main_():
+    rng = random.Random(ARGS.seed)
+    db.init_db()
+    engine = _bench_engine()
+    seed(engine, rng)
+
+    with Session(engine) as s:
+        sizes = {
+            "owners": s.query(func.count(User.tg_user_id)).scalar(),
+            "people": s.query(func.count(Person.id)).scalar(),
+            "debts": s.query(func.count(Debt.id)).scalar(),
+        }
+
+    report = {
+        "dialect": engine.dialect.name,
+        "config": {k: v for k, v in vars(ARGS).items() if k not in ("url", "out")},
+        "sizes": sizes,
+        "results": run(engine, rng),
+    }
+    with open(ARGS.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"→ {ARGS.out}")
+
+
+if __name__ == "__main__":
+    main_()
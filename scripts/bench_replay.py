@@ -0,0 +1,376 @@
+"""Load test للبوت كامل بدون Telegram: updates وهمية بتمرق من Application الحقيقي.
+
+    python scripts/bench_replay.py --url sqlite:////tmp/replay.db --users 2000 --updates 20000
+    python scripts/bench_replay.py --replay updates.jsonl --mode concurrent
+
+نفس build_application تبع main.py (كل الـ handler groups والمحادثات والـ persistence
+والـ scheduler)، بس الـ Bot بيحكي مع request وهمي بيسجّل الطلبات وبيرد بعد
+--api-latency-ms. بيطلع updates/sec وتوزيع الـ latency (من لحظة دخول الـ update
+للطابور لحد ما يخلص) وتأخير الـ event loop، لـ polling (update ورا update) و concurrent.
+
+ما تشغّله على قاعدة الإنتاج: المحادثات بتضيف ديون.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///bench.db", help="قاعدة البيانات تبع الـ benchmark")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=10000, help="تقريباً، الجلسات ما بتنقطع بالنص")
+    parser.add_argument("--mode", choices=("polling", "concurrent", "both"), default="both")
+    parser.add_argument("--concurrency", type=int, default=None, help="افتراضياً CONCURRENT_UPDATES")
+    parser.add_argument("--api-latency-ms", type=float, default=30.0, help="زمن رد Telegram الوهمي")
+    parser.add_argument("--rate", type=float, default=0, help="updates/sec، 0 = كلهم دفعة وحدة")
+    parser.add_argument("--replay", help="ملف JSONL فيه updates (dict تبع Telegram بكل سطر)")
+    parser.add_argument("--dump", help="يكتب الـ updates المولّدة JSONL حتى تنعاد")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_replay.json")
+    return parser.parse_args()
+
+
+ARGS = _parse_args()
+
+os.environ["DATABASE_URL"] = ARGS.url
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+from sqlalchemy import func, insert
+from telegram import Update
+from telegram.request import BaseRequest
+
+import db
+from db import User, Person, Debt
+from access import access_cache
+from callbacks import encode
+import main
+import summary
+
+
+FIRST_UID = 5_000_000
+
+
+# ---------------------------
+# Telegram وهمي
+# ---------------------------
+
+class FakeRequest(BaseRequest):
+    """بيرد على كل طلبات الـ Bot بعد latency ثابتة وبيعدّهم حسب الـ method."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif name in ("sendMessage", "editMessageText", "sendDocument"):
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id", 0), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        elif name == "getUpdates":
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+# ---------------------------
+# توليد الـ updates
+# ---------------------------
+
+_ids = itertools.count(1)
+
+
+def _user(uid):
+    return {"id": uid, "is_bot": False, "first_name": f"u{uid}"}
+
+
+def _message(uid, text):
+    message = {
+        "message_id": next(_ids),
+        "date": int(time.time()),
+        "chat": {"id": uid, "type": "private"},
+        "from": _user(uid),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_ids), "message": message}
+
+
+def _callback(uid, data):
+    return {
+        "update_id": next(_ids),
+        "callback_query": {
+            "id": str(next(_ids)),
+            "chat_instance": str(uid),
+            "from": _user(uid),
+            "data": data,
+            "message": {
+                "message_id": next(_ids),
+                "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "bench"},
+                "text": "menu",
+            },
+        },
+    }
+
+
+def _session(rng, uid, person_id):
+    """جلسة مستخدم واحدة (لازم تنبعت بالترتيب)."""
+    kind = rng.choices(
+        ["browse", "add", "person", "partial", "misc"],
+        weights=[35, 25, 20, 10, 10],
+    )[0]
+    if kind == "browse":
+        return [_message(uid, "/start"), _callback(uid, encode("people")), _callback(uid, encode("menu"))]
+    if kind == "add":
+        return [
+            _callback(uid, encode("add")),
+            _message(uid, f"person {rng.randint(1, 50)}"),
+            _message(uid, str(rng.randint(1, 500))),
+        ]
+    if kind == "person":
+        return [_callback(uid, encode("people")), _callback(uid, encode("person", person_id))]
+    if kind == "partial":
+        return [
+            _callback(uid, encode("person", person_id)),
+            _callback(uid, encode("partial", person_id)),
+            _message(uid, str(rng.randint(1, 5))),
+        ]
+    return [_message(uid, "/help"), _callback(uid, encode("help")), _message(uid, f"/rate {rng.randint(10000, 15000)}")]
+
+
+def generate(rng, people: dict, total: int):
+    """جلسات لمستخدمين عشوائيين، متداخلة مع بعض بس كل جلسة بترتيبها."""
+    queues = []
+    count = 0
+    uids = list(people)
+    while count < total:
+        uid = rng.choice(uids)
+        steps = _session(rng, uid, people[uid])
+        queues.append(steps)
+        count += len(steps)
+
+    # نفس المستخدم ممكن يكون إله أكتر من جلسة، فمنجمعهم حتى يضل الترتيب محفوظ
+    per_user = {}
+    for steps in queues:
+        per_user.setdefault(_uid_of(steps[0]), []).extend(steps)
+
+    pending = [list(reversed(steps)) for steps in per_user.values()]
+    stream = []
+    while pending:
+        i = rng.randrange(len(pending))
+        stream.append(pending[i].pop())
+        if not pending[i]:
+            pending[i] = pending[-1]
+            pending.pop()
+    return stream
+
+
+def _uid_of(data: dict) -> int:
+    body = data.get("message") or data.get("callback_query")
+    return body["from"]["id"]
+
+
+def seed(users: int) -> dict:
+    """مستخدمين مشتركين، كل واحد عنده شخص ودين. يرجع {uid: person_id}."""
+    uids = list(range(FIRST_UID, FIRST_UID + users))
+    with db.SessionLocal() as s:
+        existing = {
+            uid for (uid,) in s.query(User.tg_user_id).filter(User.tg_user_id.in_(uids))
+        }
+        missing = [uid for uid in uids if uid not in existing]
+        if missing:
+            s.execute(insert(User), [
+                {"tg_user_id": uid, "is_active": True, "is_blocked": False, "usd_rate": 14000.0}
+                for uid in missing
+            ])
+            s.execute(insert(Person), [
+                {"owner_user_id": uid, "name": "bench", "name_key": "bench"} for uid in missing
+            ])
+            person_of = dict(
+                s.query(Person.owner_user_id, func.min(Person.id))
+                .filter(Person.owner_user_id.in_(missing))
+                .group_by(Person.owner_user_id)
+            )
+            s.execute(insert(Debt), [
+                {"owner_user_id": uid, "person_id": person_of[uid], "amount_minor": 1_000_000,
+                 "currency": "USD", "status": "open"}
+                for uid in missing
+            ])
+            summary.rebuild(s)
+            s.commit()
+
+        return dict(
+            s.query(Person.owner_user_id, func.min(Person.id))
+            .filter(Person.owner_user_id.in_(uids))
+            .group_by(Person.owner_user_id)
+        )
+
+
+# ---------------------------
+# التشغيل
+# ---------------------------
+
+def _percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def _distribution(values_ms) -> dict:
+    return {
+        "p50_ms": round(_percentile(values_ms, 0.50), 2),
+        "p90_ms": round(_percentile(values_ms, 0.90), 2),
+        "p99_ms": round(_percentile(values_ms, 0.99), 2),
+        "max_ms": round(max(values_ms, default=0.0), 2),
+    }
+
+
+async def _watch_loop(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    """كل interval بيقيس قديش تأخر الـ loop عن الموعد."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected) * 1000)
+
+
+async def run_mode(name: str, workers: int, stream: list) -> dict:
+    access_cache.clear()
+    request = FakeRequest(ARGS.api_latency_ms / 1000)
+    app = main.build_application(request=request, concurrent_updates=workers)
+
+    queued_at = {}
+    latencies = []
+    process_update = app.process_update
+
+    async def timed_process_update(update):
+        try:
+            await process_update(update)
+        finally:
+            latencies.append((time.perf_counter() - queued_at.pop(update.update_id)) * 1000)
+
+    # الـ fetcher تبع PTB بينادي self.process_update، فالـ attribute عالـ instance بيغطي
+    app.process_update = timed_process_update
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+    lags = []
+    stop_watch = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop(lags, stop_watch))
+
+    updates = [Update.de_json(data, app.bot) for data in stream]
+    started = time.perf_counter()
+    for i, update in enumerate(updates):
+        if ARGS.rate:
+            delay = started + i / ARGS.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        queued_at[update.update_id] = time.perf_counter()
+        await app.update_queue.put(update)
+
+    # updates بتنرمى إذا طابور المستخدم تعبى، فمنحسبهم خالصين
+    processor = app.update_processor
+    while len(latencies) + processor.dropped < len(stream):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    stop_watch.set()
+    await watcher
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+
+    result = {
+        "workers": workers,
+        "updates": len(stream),
+        "processed": len(latencies),
+        "dropped": processor.dropped,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency": _distribution(latencies),
+        "loop_lag": _distribution(lags),
+        "api_calls": dict(request.calls),
+    }
+    print(
+        f"{name:<11} workers {workers:>3}  {result['updates_per_sec']:>8} upd/s  "
+        f"p50 {result['latency']['p50_ms']:>8}ms  p99 {result['latency']['p99_ms']:>8}ms  "
+        f"lag p99 {result['loop_lag']['p99_ms']:>6}ms  dropped {result['dropped']}"
+    )
+    return result
+
+
+def _load_stream(rng) -> list:
+    if ARGS.replay:
+        with open(ARGS.replay, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    stream = generate(rng, seed(ARGS.users), ARGS.updates)
+    if ARGS.dump:
+        with open(ARGS.dump, "w", encoding="utf-8") as f:
+            for data in stream:
+                f.write(json.dumps(data) + "\n")
+    return stream
+
+
+async def amain():
+    rng = random.Random(ARGS.seed)
+    db.init_db()
+    stream = _load_stream(rng)
+    print(f"{len(stream)} update من {len({_uid_of(d) for d in stream})} مستخدم")
+
+    modes = []
+    if ARGS.mode in ("polling", "both"):
+        modes.append(("polling", 1))
+    if ARGS.mode in ("concurrent", "both"):
+        modes.append(("concurrent", ARGS.concurrency or main.CONCURRENT_UPDATES))
+
+    report = {
+        "config": {k: v for k, v in vars(ARGS).items() if k not in ("url", "out")},
+        "results": {},
+    }
+    for name, workers in modes:
+        report["results"][name] = await run_mode(name, workers, stream)
+
+    with open(ARGS.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"→ {ARGS.out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(amain())
@@ -0,0 +1,126 @@
+"""كم بياخد البوت من التشغيل لحد ما يرد على أول update (deploy / restart بعد crash).
+
+    python scripts/bench_startup.py --url sqlite:////tmp/bench.db
+    python scripts/bench_startup.py --url postgresql://localhost/bench --runs 10 --api-latency-ms 50
+
+كل تشغيلة process جديدة (import بارد)، Telegram وهمي متل scripts/bench_replay.py.
+المراحل: import main → init_db → build_application → initialize + post_init
+→ أول /start. بيطلع p50/max لكل مرحلة وبيكتبهم JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+PHASES = ["import", "init_db", "build", "initialize", "first_update", "total"]
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///bench.db", help="قاعدة البيانات تبع الـ benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="زمن رد Telegram الوهمي")
+    parser.add_argument("--out", default="bench_startup.json")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+# ---------------------------
+# تشغيلة وحدة (process لحالها)
+# ---------------------------
+
+def _child(args):
+    started = time.perf_counter()
+    marks = {}
+
+    def mark(name):
+        marks[name] = time.perf_counter() - started
+
+    os.environ["DATABASE_URL"] = args.url
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    # bench_replay بيقرأ argv وقت الـ import
+    sys.argv = sys.argv[:1]
+
+    import main
+    mark("import")
+
+    main.init_db()
+    # نفس main.main()
+    threading.Thread(target=main.warm_pool, daemon=True).start()
+    mark("init_db")
+
+    from telegram import Update
+    from bench_replay import FakeRequest, _message
+
+    app = main.build_application(request=FakeRequest(args.api_latency_ms / 1000))
+    mark("build")
+
+    async def run():
+        await app.initialize()
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        mark("initialize")
+
+        await app.process_update(Update.de_json(_message(1, "/start"), app.bot))
+        mark("first_update")
+
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+
+    asyncio.run(run())
+    marks["total"] = marks["first_update"]
+    print(json.dumps(marks))
+
+
+# ---------------------------
+# كل التشغيلات
+# ---------------------------
+
+def _p(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    args = _parse_args()
+    if args.child:
+        _child(args)
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", "--url", args.url,
+             "--api-latency-ms", str(args.api_latency_ms)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+
+    result = {}
+    for phase in PHASES:
+        # كل مرحلة لحالها (الفرق عن اللي قبلها)، إلا total
+        values = [
+            r[phase] - (r[PHASES[PHASES.index(phase) - 1]] if 0 < PHASES.index(phase) < len(PHASES) - 1 else 0)
+            for r in runs
+        ]
+        result[phase] = {"p50_ms": round(_p(values, 0.5) * 1000, 1), "max_ms": round(max(values) * 1000, 1)}
+        print(f"{phase:<14} p50 {result[phase]['p50_ms']:>8.1f}ms  max {result[phase]['max_ms']:>8.1f}ms")
+
+    with open(args.out, "w") as f:
+        json.dump({"url": args.url, "runs": args.runs, "phases": result}, f, indent=2)
+    print(f"→ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""يطبع خطة التنفيذ (EXPLAIN) لكل استعلام بتعمله الـ handlers.
+
+    DATABASE_URL=... python scripts/explain_queries.py [--owner USER_ID]
+
+كل حالة بتشتغل جوّا transaction وبترجع rollback، فالسكربت ما بيغيّر شي بالقاعدة.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import db
+from db import Person, Debt
+import main
+import analytics
+import broadcast
+import ledger
+import payments
+import persistence
+import subscriptions
+import summary
+from balances import person_summary
+from handlers import add_debt, people
+
+
+def _cases(uid: int, person_id: int):
+    return [
+        ("check_access", main._load_access, (uid,)),
+        ("/start", main._start_user, (uid,)),
+        ("list_people", people._load_people_page, (uid,)),
+        ("list_people (next page)", people._load_people_page, (uid, person_id)),
+        ("show_person", person_summary, (uid, person_id)),
+        ("save_debt", add_debt._save_debt, (uid, "explain", 100)),
+        ("partial_save", payments.allocate_payment, (uid, person_id, 1)),
+        ("delete_all", people._delete_debts, (uid, person_id)),
+        ("statement", ledger.statement, (uid, person_id)),
+        ("main menu", summary.load, (uid,)),
+        ("stats", analytics._collect, ()),
+        ("broadcast chunk", broadcast._next_chunk, (0, broadcast.CHUNK_SIZE)),
+        ("expiry sweep", subscriptions._deactivate_expired, (datetime.utcnow(),)),
+        ("user_data", persistence._load_user_data, (uid,)),
+    ]
+
+
+_SKIP = ("SAVEPOINT", "RELEASE", "ROLLBACK", "BEGIN", "COMMIT")
+
+
+def _capture(fn, args):
+    """يشغّل fn جوّا transaction بيرجع rollback ويرجع الاستعلامات اللي انبعتت."""
+    captured = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(_SKIP):
+            captured.append((statement, parameters[0] if executemany else parameters))
+
+    with db.engine.connect() as conn:
+        outer = conn.begin()
+        event.listen(conn, "before_cursor_execute", before)
+        try:
+            session = Session(bind=conn)
+            fn(session, *args)
+            session.close()
+        finally:
+            event.remove(conn, "before_cursor_execute", before)
+            outer.rollback()
+    return captured
+
+
+def _explain(conn, statement, parameters):
+    if conn.dialect.name == "postgresql":
+        rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).all()
+        return [row[0] for row in rows]
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return [row[-1] for row in rows]
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--owner", type=int, help="مالك للتجربة (افتراضياً أول مالك عنده أشخاص)")
+    args = parser.parse_args()
+
+    db.init_db()
+    with db.SessionLocal() as s:
+        uid = args.owner or s.query(Person.owner_user_id).order_by(Person.id).limit(1).scalar()
+        if uid is None:
+            sys.exit("ما في أشخاص بالقاعدة، ضيف بيانات أو مرّر --owner")
+        person_id = (
+            s.query(Debt.person_id).filter(Debt.owner_user_id == uid).limit(1).scalar()
+            or s.query(Person.id).filter(Person.owner_user_id == uid).limit(1).scalar()
+            or 0
+        )
+
+    for label, fn, fn_args in _cases(uid, person_id):
+        print("=" * 70)
+        print(label)
+        for statement, parameters in _capture(fn, fn_args):
+            print("-" * 70)
+            print(" ".join(statement.split()))
+            with db.engine.connect() as conn:
+                for line in _explain(conn, statement, parameters):
+                    print("   ", line)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,85 @@
+"""يتأكد إن القراءات بتروح للـ replica والكتابات للـ primary (شوف RoutingSession بـ db.py).
+
+    python scripts/replica_check.py --primary sqlite:////tmp/primary.db --replica sqlite:////tmp/replica.db
+    python scripts/replica_check.py --primary postgresql://localhost:5432/debts --replica postgresql://localhost:5433/debts
+
+مع قاعدتين SQLite ما في replication: الـ replica بتضل فاضية، فلما القراءة
+تروح عليها ما بتشوف الكتابة، وهيك بيبيّن وين راح كل استعلام. مع Postgres
+وreplica حقيقية (streaming) بيبيّن تأخيرها كمان.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--primary", required=True)
+    parser.add_argument("--replica", required=True)
+    parser.add_argument("--owner", type=int, default=990001)
+    parser.add_argument("--window", type=float, default=1.0, help="REPLICA_LAG_WINDOW للتجربة")
+    return parser.parse_args()
+
+
+ARGS = _parse_args()
+
+# db.py بيقرأ الـ env وقت الـ import
+os.environ["DATABASE_URL"] = ARGS.primary
+os.environ["READ_DATABASE_URL"] = ARGS.replica
+os.environ["REPLICA_LAG_WINDOW"] = str(ARGS.window)
+
+from sqlalchemy import event
+
+import db
+from db import run_db, unit_of_work
+from handlers import add_debt, people
+
+
+COUNTS = {}
+
+
+def _count(name, engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        COUNTS[name] = COUNTS.get(name, 0) + 1
+
+
+async def _step(title, fn, *args):
+    COUNTS.clear()
+    async with unit_of_work(ARGS.owner):
+        result = await run_db(fn, *args)
+    print(f"{title:<42} primary {COUNTS.get('primary', 0):>2}  replica {COUNTS.get('replica', 0):>2}  → {result!r:.60}")
+    return result
+
+
+async def _main():
+    db.init_db()
+    if "sqlite" in ARGS.replica:
+        # بدون replication: بس الجداول
+        db.Base.metadata.create_all(bind=db.read_engine)
+
+    _count("primary", db.engine)
+    _count("replica", db.read_engine)
+
+    await _step("save_debt (كتابة)", add_debt._save_debt, ARGS.owner, "replica check", 100)
+    await _step("list_people بعد الكتابة مباشرة", people._load_people_page, ARGS.owner)
+
+    time.sleep(ARGS.window + 0.1)
+    await _step("list_people بعد REPLICA_LAG_WINDOW", people._load_people_page, ARGS.owner)
+
+    # قراءة وبعدها كتابة بنفس الـ update
+    COUNTS.clear()
+    async with unit_of_work(ARGS.owner):
+        await run_db(people._load_people_page, ARGS.owner)
+        after_read = dict(COUNTS)
+        await run_db(add_debt._save_debt, ARGS.owner, "replica check", 1)
+    print(f"{'list_people + save_debt بنفس الـ update':<42} "
+          f"read: {after_read}  total: {dict(COUNTS)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
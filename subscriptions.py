@@ -0,0 +1,89 @@
+import os
+from datetime import datetime, timedelta
+from functools import partial
+
+from sqlalchemy import or_, update
+
+from db import run_db, after_commit, User
+from access import access_cache
+from broadcast import TokenBucket, send_one, BROADCAST_RATE
+
+
+# كل كم ثانية منفحص الاشتراكات، وقبل كم يوم منبعت تنبيه (0 = بدون تنبيه)
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", "300"))
+EXPIRY_NOTICE_DAYS = int(os.getenv("EXPIRY_NOTICE_DAYS", "3"))
+
+EXPIRED_MSG = "⌛ انتهى اشتراكك. 📩 تواصل مع الأدمن للتجديد."
+NOTICE_MSG = "⏳ اشتراكك ينتهي بتاريخ {date}. 📩 تواصل مع الأدمن للتجديد."
+
+
+# ---------------------------
+# استعلامات (تشتغل داخل run_db) — UPDATE واحد لكل دفعة، مو مستخدم مستخدم
+# ---------------------------
+
+def _deactivate_expired(db, now: datetime):
+    rows = db.execute(
+        update(User)
+        .where(
+            User.is_active == True,
+            User.sub_expires_at.isnot(None),
+            User.sub_expires_at <= now,
+        )
+        .values(is_active=False)
+        .returning(User.tg_user_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    expired = [uid for (uid,) in rows]
+    # invalidate (مو update) بعد الـ commit: check_access بلّش تحميل قبل الـ UPDATE
+    # ما لازم يرجّع الحالة الفعّالة للكاش (نفس admin_panel._invalidate_access)
+    after_commit(db, partial(_invalidate_access, expired))
+    return expired
+
+
+def _invalidate_access(uids):
+    for uid in uids:
+        access_cache.invalidate(uid)
+
+
+def _claim_expiry_notices(db, now: datetime, days: int):
+    """يعلّم المستخدمين اللي قرب ينتهي اشتراكهم ويرجعهم، كل اشتراك مرة وحدة."""
+    rows = db.execute(
+        update(User)
+        .where(
+            User.is_active == True,
+            User.sub_expires_at > now,
+            User.sub_expires_at <= now + timedelta(days=days),
+            or_(User.expiry_notice_for.is_(None), User.expiry_notice_for != User.sub_expires_at),
+        )
+        .values(expiry_notice_for=User.sub_expires_at)
+        .returning(User.tg_user_id, User.sub_expires_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return [(uid, expires_at) for uid, expires_at in rows]
+
+
+# ---------------------------
+# الـ job
+# ---------------------------
+
+async def sweep(bot, admin_ids=()):
+    now = datetime.utcnow()
+    # كاش الصلاحيات بينمسح للمنتهين (after_commit)، فـ check_access ما بيحتاج يفحص التاريخ
+    expired = await run_db(_deactivate_expired, now)
+
+    notices = []
+    if EXPIRY_NOTICE_DAYS > 0:
+        notices = await run_db(_claim_expiry_notices, now, EXPIRY_NOTICE_DAYS)
+
+    bucket = TokenBucket(BROADCAST_RATE)
+    for uid in expired:
+        if uid not in admin_ids:
+            await send_one(bot, bucket, uid, EXPIRED_MSG)
+    for uid, expires_at in notices:
+        await send_one(bot, bucket, uid, NOTICE_MSG.format(date=expires_at.strftime("%Y-%m-%d")))
+
+    return len(expired), len(notices)
+
+
+async def sweep_job(context):
+    await sweep(context.bot, context.application.bot_data.get("ADMIN_IDS", set()))
@@ -0,0 +1,120 @@
+from sqlalchemy import case, func, select, union
+
+from db import read_only, Person, Debt, OwnerSummary
+from money import format_minor
+
+
+# ---------------------------
+# ملخص كل مالك: عدد الأشخاص، الديون المفتوحة، ومجموع كل عملة (بالوحدة الصغرى).
+# كل كتابة على people/debts تعدّل الصف بزيادة/نقصان (UPDATE ... SET x = x + n)
+# فقراءة القائمة الرئيسية = قراءة صف واحد بالـ primary key.
+# كل الدوال تشتغل داخل run_db وما تعمل commit (run_db بيعملها، شوف db.py).
+# ---------------------------
+
+def _totals_select(uid: int = None):
+    people = select(Person.owner_user_id.label("owner"), func.count().label("n"))
+    debts = select(
+        Debt.owner_user_id.label("owner"),
+        func.count().label("n"),
+        func.sum(case((Debt.currency == "USD", Debt.amount_minor), else_=0)).label("usd"),
+        func.sum(case((Debt.currency == "SYP", Debt.amount_minor), else_=0)).label("syp"),
+    ).where(Debt.status == "open")
+
+    if uid is not None:
+        people = people.where(Person.owner_user_id == uid)
+        debts = debts.where(Debt.owner_user_id == uid)
+
+    people = people.group_by(Person.owner_user_id).subquery()
+    debts = debts.group_by(Debt.owner_user_id).subquery()
+    owners = union(select(people.c.owner), select(debts.c.owner)).subquery()
+
+    return (
+        select(
+            owners.c.owner,
+            func.coalesce(people.c.n, 0),
+            func.coalesce(debts.c.n, 0),
+            func.coalesce(debts.c.usd, 0),
+            func.coalesce(debts.c.syp, 0),
+        )
+        .select_from(owners)
+        .outerjoin(people, people.c.owner == owners.c.owner)
+        .outerjoin(debts, debts.c.owner == owners.c.owner)
+    )
+
+
+_COLUMNS = ["owner_user_id", "people_count", "open_debts", "usd_minor", "syp_minor"]
+
+
+def rebuild(db, uid: int = None) -> int:
+    """يعيد حساب الملخص من الصفر (لمالك واحد أو للكل). يرجع عدد الصفوف."""
+    delete = db.query(OwnerSummary)
+    if uid is not None:
+        delete = delete.filter(OwnerSummary.owner_user_id == uid)
+    delete.delete(synchronize_session=False)
+
+    result = db.execute(
+        OwnerSummary.__table__.insert().from_select(_COLUMNS, _totals_select(uid))
+    )
+    if uid is not None and not result.rowcount:
+        # مالك بدون بيانات: صف أصفار حتى الـ bump الجاي يكون UPDATE بس
+        db.add(OwnerSummary(owner_user_id=uid, people_count=0, open_debts=0, usd_minor=0, syp_minor=0))
+        db.flush()
+        return 1
+    return result.rowcount
+
+
+def bump(db, uid: int, people: int = 0, debts: int = 0, currency: str = None, amount_minor: int = 0):
+    """يعدّل ملخص المالك بالفرق. إذا ما في صف بعد، يبنيه من الصفر
+    (لازم يتنادى بعد الكتابة نفسها وبنفس الـ transaction)."""
+    values = {
+        OwnerSummary.people_count: OwnerSummary.people_count + people,
+        OwnerSummary.open_debts: OwnerSummary.open_debts + debts,
+    }
+    if currency == "USD":
+        values[OwnerSummary.usd_minor] = OwnerSummary.usd_minor + amount_minor
+    elif currency == "SYP":
+        values[OwnerSummary.syp_minor] = OwnerSummary.syp_minor + amount_minor
+
+    updated = (
+        db.query(OwnerSummary)
+        .filter(OwnerSummary.owner_user_id == uid)
+        .update(values, synchronize_session=False)
+    )
+    if not updated:
+        rebuild(db, uid)
+
+
+@read_only
+def load(db, uid: int):
+    """الملخص (من الـ replica إذا في)، أو None إذا لسا ما انبنى: وقتها rebuild_and_load
+    على الـ primary، لأن الـ replica ما بتنكتب ويمكن تكون متأخرة."""
+    row = db.query(OwnerSummary).filter(OwnerSummary.owner_user_id == uid).first()
+    if row is None:
+        return None
+    return _as_dict(row)
+
+
+def rebuild_and_load(db, uid: int) -> dict:
+    # rebuild بيكتب صف حتى لمالك بدون بيانات
+    rebuild(db, uid)
+    return _as_dict(db.query(OwnerSummary).filter(OwnerSummary.owner_user_id == uid).one())
+
+
+def _as_dict(row) -> dict:
+    return {
+        "people": row.people_count,
+        "debts": row.open_debts,
+        "USD": row.usd_minor,
+        "SYP": row.syp_minor,
+    }
+
+
+def format_summary(data: dict) -> str:
+    lines = [
+        f"👥 الأشخاص: {data['people']}",
+        f"🧾 الديون المفتوحة: {data['debts']}",
+        f"💵 USD: {format_minor(data['USD'])}",
+    ]
+    if data["SYP"]:
+        lines.append(f"💴 SYP: {format_minor(data['SYP'])}")
+    return "\n".join(lines)